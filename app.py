@@ -1,6 +1,18 @@
 import dash
 import layout
 import callbacks
+from data.dfgraph import DFGraph
+from data.graphdata import GraphData, portrait_manifest
+from instrumentation import CallbackMetrics
+from compression import register_response_compression
+from config import (
+    PORTRAIT_WATCH_INTERVAL_SECONDS,
+    INSTRUMENTATION_ENABLED,
+    RESPONSE_COMPRESSION_MIN_BYTES,
+    SLOW_CALLBACK_THRESHOLD_SECONDS,
+    NEIGHBORHOOD_CACHE_WARM_UP_NODES,
+    NEIGHBORHOOD_CACHE_WARM_UP_RANKING,
+)
 
 # external CSS stylesheets
 external_stylesheets = [
@@ -15,5 +27,29 @@ if __name__ == "__main__":
     )
 
     app.layout = layout.layout
-    callbacks.register_callbacks(app)
+
+    callback_metrics = None
+    if INSTRUMENTATION_ENABLED:
+        callback_metrics = CallbackMetrics(SLOW_CALLBACK_THRESHOLD_SECONDS)
+        callback_metrics.instrument_classes(GraphData, DFGraph)
+        callback_metrics.register_cache(
+            "filtered_graphs", callbacks.shared_data.filtered_graph_cache
+        )
+        callback_metrics.register_cache(
+            "neighborhoods", callbacks.shared_data.neighborhood_cache
+        )
+        callback_metrics.register_route(app.server)
+    callbacks.register_callbacks(app, callback_metrics)
+
+    if NEIGHBORHOOD_CACHE_WARM_UP_NODES > 0:
+        callbacks.shared_data.warm_up_neighborhood_cache(
+            NEIGHBORHOOD_CACHE_WARM_UP_NODES, NEIGHBORHOOD_CACHE_WARM_UP_RANKING
+        )
+
+    portrait_manifest.register_route(app.server)
+    if RESPONSE_COMPRESSION_MIN_BYTES > 0:
+        register_response_compression(app.server, RESPONSE_COMPRESSION_MIN_BYTES)
+    # Pick up new portraits without restarting the app
+    portrait_manifest.start_watching(PORTRAIT_WATCH_INTERVAL_SECONDS)
+
     app.run_server(debug=True, port=8050)
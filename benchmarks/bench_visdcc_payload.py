@@ -0,0 +1,114 @@
+"""
+Microbenchmark of the visdcc payload built by GraphData.create_visddc_network, comparing the
+vectorized implementation with the previous row-by-row implementation.
+
+Run from the repository root:
+    python -m benchmarks.bench_visdcc_payload
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from data.graphdata import GraphData
+from config import FILE_PATH_FOR_IMAGES
+
+SIZES = [10_000, 100_000]
+EDGES_PER_NODE = 2
+REPEATS = 3
+
+
+def create_portrait_image_path_rowwise(node):
+    image_path = os.path.join(FILE_PATH_FOR_IMAGES, f"{node['id']}.png")
+
+    if os.path.exists(image_path):
+        return image_path
+    else:
+        return "https://e7.pngegg.com/pngimages/549/612/png-clipart-three-headed-dragon-illustration-daenerys-targaryen-tyrion-lannister-sansa-stark-house-targaryen-house-stark-throne-miscellaneous-dragon-thumbnail.png"
+
+
+def create_visddc_network_rowwise(data: GraphData, nodes, edges):
+    """
+    create_visddc_network as it was before it was vectorized, when the graph was stored with
+    string node ids in the schema of the CSV files
+    """
+    dict_nodes = nodes.to_dict("records")
+    dict_edges = edges.to_dict("records")
+
+    node_coloring = {"male": "#FCFEF0", "female": "#B9540C"}
+
+    nodes = [
+        {
+            "id": node["id"],
+            "label": None,
+            "image": create_portrait_image_path_rowwise(node),
+            "shape": "circularImage",
+            "imagePadding": {"left": 200, "top": 100, "right": 80, "bottom": 20},
+            "borderWidth": 10,
+            "size": data.graph_whole.get_node_size(node["screentime"]),
+            "color": node_coloring[node["gender"]],
+            "font": {
+                "size": "20",
+                "face": "'Trajan Pro'",
+                "color": "white",
+            },
+            "title": f"""Name: {node["id"].replace("-", " ")} <br> Gender: {node['gender']} <br> Screentine: {node['screentime']}""",
+        }
+        for node in dict_nodes
+    ]
+
+    edges = [
+        {
+            "id": edge["from"] + "__" + edge["to"],
+            "from": edge["from"],
+            "to": edge["to"],
+            "width": data.graph_whole.get_edge_width(edge["weight"]),
+        }
+        for edge in dict_edges
+    ]
+
+    return {"nodes": nodes, "edges": edges}
+
+
+def create_random_graph(num_nodes, num_edges, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = pd.Series([f"Character-{i}" for i in range(num_nodes)])
+    nodes = pd.DataFrame(
+        {
+            "id": ids,
+            "gender": rng.choice(["male", "female"], num_nodes),
+            "screentime": rng.exponential(40, num_nodes).round(2),
+        }
+    )
+    edges = pd.DataFrame(
+        {
+            "from": ids[rng.integers(0, num_nodes, num_edges)].to_numpy(),
+            "to": ids[rng.integers(0, num_nodes, num_edges)].to_numpy(),
+            "weight": rng.integers(11, 300, num_edges),
+            "strength": "medium",
+        }
+    )
+    return nodes, edges
+
+
+def best_time(function, *args):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    print(f"{'nodes':>8} {'edges':>8} {'row-wise [s]':>13} {'vectorized [s]':>15}")
+    for num_nodes in SIZES:
+        nodes, edges = create_random_graph(num_nodes, EDGES_PER_NODE * num_nodes)
+        data = GraphData(nodes, edges)
+        data.graph_display = data.graph_whole
+
+        rowwise = best_time(create_visddc_network_rowwise, data, nodes, edges)
+        vectorized = best_time(data.create_visddc_network)
+        print(
+            f"{num_nodes:>8} {edges.shape[0]:>8} {rowwise:>13.3f} {vectorized:>15.3f}"
+        )
@@ -0,0 +1,303 @@
+"""
+Benchmarks of the DFGraph and GraphData hot paths on synthetic graphs of increasing size.
+Reports the time and peak traced memory of each operation, and writes them as JSON so runs on
+different commits can be compared. Operations are named after the function or method they time.
+The graphs are loaded with load_got, which keeps its cache next to the CSV files.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 100000 1000000 --output results.json
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from copy import copy
+import numpy as np
+from data import load_data
+from data.graphdata import GraphData
+from data.centrality import compute_centrality
+from data.utils import GraphFilterParams
+from .synthetic_graph import write_synthetic_csvs
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+NUM_EXPANSIONS = 20
+
+
+def measure(setup, operation, repeats):
+    """
+    Time operation(setup()) repeats times, then run it once more with tracemalloc to get its
+    peak memory. setup is not timed.
+    """
+    seconds = []
+    for _ in range(repeats):
+        state = setup()
+        start = time.perf_counter()
+        operation(state)
+        seconds.append(time.perf_counter() - start)
+
+    state = setup()
+    tracemalloc.start()
+    operation(state)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds_min": min(seconds),
+        "seconds_median": statistics.median(seconds),
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def use_data_paths(node_path, edge_path, cache_path):
+    """
+    Make load_got and load_cached_arrays read the given files, and cache them under
+    cache_path, instead of the paths of config.py
+    """
+    load_data.NODE_PATH = node_path
+    load_data.EDGE_PATH = edge_path
+    load_data.CACHE_PATH = cache_path
+
+
+def benchmark_graph(node_path, edge_path, repeats, seed=0):
+    """
+    Run every benchmarked operation on the graph in the given CSV files
+    """
+    cache_path = os.path.join(os.path.dirname(node_path), "cache")
+    use_data_paths(node_path, edge_path, cache_path)
+
+    def clear_cache():
+        shutil.rmtree(cache_path, ignore_errors=True)
+        os.makedirs(cache_path)
+
+    results = {}
+    results["load_got (cold cache)"] = measure(
+        clear_cache, lambda _: load_data.load_got(), 1
+    )
+    results["load_got (warm cache)"] = measure(
+        lambda: None, lambda _: load_data.load_got(), repeats
+    )
+    # Computes the community labels and centrality on the first run, and loads them from the
+    # cache on the timed runs
+    GraphData()
+    results["GraphData.__init__ (warm cache)"] = measure(
+        lambda: None, lambda _: GraphData(), repeats
+    )
+
+    data = GraphData()
+    whole = data.graph_whole
+    node_names = data.node_names.decode(whole.nodes["id"])
+
+    # The node with the most edges, and random nodes to expand and delete
+    degrees = np.bincount(
+        np.concatenate([whole.edges["from"], whole.edges["to"]]),
+        minlength=len(data.node_names),
+    )
+    hub = data.node_names.decode_one(int(np.argmax(degrees)))
+    rng = np.random.default_rng(seed)
+    clicked_nodes = rng.choice(node_names, NUM_EXPANSIONS)
+
+    filter_params = GraphFilterParams(
+        float(whole.nodes["screentime"].median()),
+        float(whole.edges["weight"].median()),
+        ["male", "female"],
+    )
+
+    results["compute_centrality"] = measure(
+        lambda: whole,
+        lambda whole: compute_centrality(whole, len(data.node_names)),
+        1,
+    )
+
+    def filter_graph(graph):
+        graph.filter_graph(filter_params)
+
+    results["DFGraph.filter_graph"] = measure(
+        lambda: copy(whole), filter_graph, repeats
+    )
+
+    # Sessions share the filtered graph cache, so it is cleared to time the filtering
+    def create_session():
+        data.filtered_graph_cache.clear()
+        return data.new_session()
+
+    def update_filter(session):
+        session.update_filter(filter_params)
+
+    results["GraphData.update_filter"] = measure(create_session, update_filter, repeats)
+
+    def create_filtered_session():
+        session = create_session()
+        session.update_filter(filter_params)
+        data.filtered_graph_cache.clear()
+        return session
+
+    def update_filter_incrementally(session):
+        session.update_filter(
+            GraphFilterParams(filter_params.min_screentime * 2, None, None)
+        )
+
+    results["GraphData.update_filter (incremental)"] = measure(
+        create_filtered_session, update_filter_incrementally, repeats
+    )
+
+    def create_session_with_cached_filter():
+        data.new_session().update_filter(filter_params)
+        return data.new_session()
+
+    results["GraphData.update_filter (cached)"] = measure(
+        create_session_with_cached_filter, update_filter, repeats
+    )
+
+    def clear_neighborhood_cache():
+        data.neighborhood_cache.clear()
+        return data
+
+    for n_hops in [1, 2, 3]:
+        results[f"GraphData.get_neighborhood_around_node ({n_hops} hops)"] = measure(
+            clear_neighborhood_cache,
+            lambda data: data.get_neighborhood_around_node(hub, n_hops),
+            repeats,
+        )
+    results["GraphData.get_neighborhood_around_node (2 hops, cached)"] = measure(
+        lambda: data,
+        lambda data: data.get_neighborhood_around_node(hub, 2),
+        repeats,
+    )
+
+    hub_id = data.node_names.encode_one(hub)
+    clicked_node_ids = data.node_names.encode(clicked_nodes).tolist()
+    results[f"DFGraph.get_shortest_path ({NUM_EXPANSIONS} paths)"] = measure(
+        lambda: whole,
+        lambda whole: [
+            whole.get_shortest_path(hub_id, node_id) for node_id in clicked_node_ids
+        ],
+        repeats,
+    )
+
+    def create_display_session():
+        session = data.new_session()
+        session.set_display_graph(session.get_neighborhood_around_node(hub, 1))
+        return session
+
+    egonets = [data.get_neighborhood_around_node(node, 1) for node in clicked_nodes]
+
+    def append_egonets(session):
+        for egonet in egonets:
+            session.add_subgraph_to_displaygraph(egonet)
+
+    results[f"GraphData.add_subgraph_to_displaygraph ({NUM_EXPANSIONS} egonets)"] = (
+        measure(create_display_session, append_egonets, repeats)
+    )
+
+    def create_expanded_session():
+        session = create_display_session()
+        append_egonets(session)
+        return session
+
+    def delete_nodes(session):
+        for node in clicked_nodes:
+            session.delete_node_from_display_graph(node)
+
+    results[f"GraphData.delete_node_from_display_graph ({NUM_EXPANSIONS} nodes)"] = (
+        measure(create_expanded_session, delete_nodes, repeats)
+    )
+
+    results["GraphData.create_visddc_network"] = measure(
+        create_expanded_session,
+        lambda session: session.create_visddc_network(),
+        repeats,
+    )
+
+    return {
+        "num_nodes": int(whole.nodes.shape[0]),
+        "num_edges": int(whole.edges.shape[0]),
+        "display_nodes": int(create_expanded_session().graph_display.nodes.shape[0]),
+        "operations": results,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous_results=None):
+    previous = {}
+    for graph in (previous_results or {}).get("graphs", []):
+        for operation, result in graph["operations"].items():
+            previous[(graph["requested_num_nodes"], operation)] = result
+
+    for graph in results["graphs"]:
+        print(
+            f"\n{graph['num_nodes']} nodes, {graph['num_edges']} edges, "
+            f"{graph['display_nodes']} displayed nodes"
+        )
+        for operation, result in graph["operations"].items():
+            line = (
+                f"  {operation:<55} {result['seconds_min']:>10.4f} s"
+                f" {result['peak_memory_bytes'] / 1024**2:>10.1f} MiB"
+            )
+            before = previous.get((graph["requested_num_nodes"], operation))
+            if before is not None:
+                line += (
+                    f"   {result['seconds_min'] / before['seconds_min']:>6.2f}x time"
+                )
+                line += f" {result['peak_memory_bytes'] / max(before['peak_memory_bytes'], 1):>6.2f}x memory"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument(
+        "--compare", help="JSON file from a previous run to compare with"
+    )
+    parser.add_argument(
+        "--data-directory",
+        help="Where to keep the generated CSV files, so they can be reused between runs",
+    )
+    args = parser.parse_args()
+
+    data_directory = args.data_directory or tempfile.mkdtemp()
+    results = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "graphs": [],
+    }
+    for num_nodes in args.sizes:
+        directory = os.path.join(data_directory, f"synthetic_{num_nodes}")
+        node_path = os.path.join(directory, "got_nodes.csv")
+        edge_path = os.path.join(directory, "got_edges.csv")
+        if not (os.path.exists(node_path) and os.path.exists(edge_path)):
+            node_path, edge_path = write_synthetic_csvs(directory, num_nodes)
+
+        graph_results = benchmark_graph(node_path, edge_path, args.repeats)
+        graph_results["requested_num_nodes"] = num_nodes
+        results["graphs"].append(graph_results)
+
+    previous_results = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous_results = json.load(file)
+    print_results(results, previous_results)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,89 @@
+"""
+Synthetic character networks in the schema of data/raw_data/got_nodes.csv and got_edges.csv,
+with a power-law degree distribution.
+
+Run from the repository root to write a graph to CSV files:
+    python -m benchmarks.synthetic_graph --num-nodes 100000 --output-directory /tmp/graph
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+
+def create_url_from_node_name(node_name):
+    return "https://gameofthrones.fandom.com/wiki/" + node_name.replace("-", "_")
+
+
+def generate_synthetic_graph(num_nodes, average_degree=4, exponent=2.5, seed=0):
+    """
+    Chung-Lu style random graph: node i gets the expected degree weight (i + 1) ** (-1 / (exponent - 1)),
+    and both endpoints of each edge are drawn with probability proportional to these weights, giving a
+    degree distribution with a power-law tail P(k) ~ k ** -exponent.
+    Self loops and duplicate pairs are dropped, so there are slightly fewer edges than requested.
+    """
+    rng = np.random.default_rng(seed)
+
+    ids = pd.Series([f"Character-{i}" for i in range(num_nodes)])
+    nodes = pd.DataFrame(
+        {
+            "id": ids,
+            "gender": rng.choice(["male", "female"], num_nodes, p=[0.75, 0.25]),
+            # Like in the real data, most characters have little screentime
+            "screentime": np.round(rng.pareto(1.5, num_nodes) * 2 + 1, 2),
+        }
+    )
+    nodes["url"] = nodes["id"].map(create_url_from_node_name)
+    nodes["image_url"] = ""
+
+    num_edges = num_nodes * average_degree // 2
+    weights = np.arange(1, num_nodes + 1) ** (-1 / (exponent - 1))
+    probabilities = weights / weights.sum()
+    endpoints = rng.choice(num_nodes, size=(num_edges, 2), p=probabilities)
+    endpoints = endpoints[endpoints[:, 0] != endpoints[:, 1]]
+    # As in got_edges.csv, each pair is listed once
+    endpoints = np.unique(np.sort(endpoints, axis=1), axis=0)
+
+    weight = np.round(rng.pareto(1.5, endpoints.shape[0]) * 10 + 11).astype(np.int64)
+    edges = pd.DataFrame(
+        {
+            "from": ids.to_numpy()[endpoints[:, 0]],
+            "to": ids.to_numpy()[endpoints[:, 1]],
+            "weight": weight,
+            "strength": np.where(weight >= 50, "high", "medium"),
+        }
+    )
+    return nodes, edges
+
+
+def write_synthetic_csvs(directory, num_nodes, **kwargs):
+    """
+    Write a synthetic graph to got_nodes.csv and got_edges.csv in directory and return their paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    nodes, edges = generate_synthetic_graph(num_nodes, **kwargs)
+    node_path = os.path.join(directory, "got_nodes.csv")
+    edge_path = os.path.join(directory, "got_edges.csv")
+    nodes.to_csv(node_path, index=False)
+    edges.to_csv(edge_path, index=False)
+    return node_path, edge_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-nodes", type=int, required=True)
+    parser.add_argument("--average-degree", type=int, default=4)
+    parser.add_argument("--exponent", type=float, default=2.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-directory", required=True)
+    args = parser.parse_args()
+
+    node_path, edge_path = write_synthetic_csvs(
+        args.output_directory,
+        args.num_nodes,
+        average_degree=args.average_degree,
+        exponent=args.exponent,
+        seed=args.seed,
+    )
+    print(f"Wrote {node_path} and {edge_path}")
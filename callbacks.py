@@ -1,11 +1,27 @@
 # %%
+import json
 import dash
+import plotly
 from dash import html
-from dash.dependencies import Input, Output
-from data.graphdata import GraphData
+from dash.dependencies import Input, Output, State
+from data.graphdata import get_shared_graph_data
+from data.session_store import SessionStore
 from data.utils import GraphFilterParams
+from config import SESSION_MAX_COUNT, SESSION_MAX_BYTES, SESSION_TTL_SECONDS
 
-data = GraphData()
+# graph_whole is loaded once and shared by all sessions. Each session has its own
+# filtered and displayed graph, stored server side under the session id of the page.
+shared_data = get_shared_graph_data()
+session_store = SessionStore(
+    shared_data.new_session,
+    max_sessions=SESSION_MAX_COUNT,
+    max_bytes=SESSION_MAX_BYTES,
+    ttl_seconds=SESSION_TTL_SECONDS,
+)
+
+
+# Values of graph_interaction_input that change the displayed graph when a node is clicked
+GRAPH_INTERACTIONS = ("expand_node", "delete_node", "expand_community", "show_path")
 
 
 def resolve_clicked_node(clicked_node):
@@ -32,7 +48,9 @@ def create_url_from_node_name(node_name):
 
 
 def create_javascript_for_character_url(triggered_id, interaction_value, clicked_node):
-    javascript = ""
+    """
+    Javascript that opens the wiki page of the clicked node, or None if no page is to be opened
+    """
     node_name = resolve_clicked_node(clicked_node)
     if (
         triggered_id == "network_visualization"
@@ -40,76 +58,203 @@ def create_javascript_for_character_url(triggered_id, interaction_value, clicked
         and node_name is not None
     ):
         url = create_url_from_node_name(node_name)
-        javascript = f"""window.open('{url}')"""
+        return f"""window.open('{url}')"""
+    return None
+
+
+def create_javascript_for_value_sync(first_id, second_id):
+    """
+    Javascript for a clientside callback that copies the value of whichever of the components
+    first_id and second_id changed into the other one, without a round trip to the server
+    """
+    return f"""
+        function(first_value, second_value) {{
+            var triggered = dash_clientside.callback_context.triggered.map(
+                function(trigger) {{ return trigger.prop_id; }}
+            );
+            if (triggered.indexOf("{first_id}.value") >= 0) {{
+                return [dash_clientside.no_update, first_value];
+            }}
+            if (triggered.indexOf("{second_id}.value") >= 0) {{
+                return [second_value, dash_clientside.no_update];
+            }}
+            return [dash_clientside.no_update, dash_clientside.no_update];
+        }}
+    """
+
+
+def create_javascript_for_network_update(network_update):
+    """
+    Javascript that applies a network update from GraphData.create_visdcc_network_update to the
+    vis.js DataSets of the visdcc network. It is run by the network through its run property,
+    where this.nn and this.ee are the node and edge DataSets. Edges have ids generated by
+    vis.js, so removed edges are looked up by their from and to nodes.
+    """
+    network_update = json.dumps(network_update, cls=plotly.utils.PlotlyJSONEncoder)
+    javascript = f"""
+        var network_update = {network_update};
+        var removed_edges = new Set(
+            network_update.edges_removed.map(function(edge) {{
+                return JSON.stringify(edge);
+            }})
+        );
+        this.ee.remove(this.ee.getIds({{
+            filter: function(edge) {{
+                return removed_edges.has(JSON.stringify([edge.from, edge.to]));
+            }}
+        }}));
+        this.nn.remove(network_update.nodes_removed);
+        this.nn.update(network_update.nodes_added);
+        this.ee.update(network_update.edges_added);
+    """
     return javascript
 
 
 def callback_network_visualization(app):
     @app.callback(
-        Output(component_id="network_visualization", component_property="data"),
+        [
+            # The whole network, sent when it has to be rendered from scratch
+            Output(component_id="network_visualization", component_property="data"),
+            # Changes to the network since the last render
+            Output(
+                component_id="network_visualization",
+                component_property="run",
+                allow_duplicate=True,
+            ),
+            Output(component_id="network_revision", component_property="data"),
+        ],
+        # Only clicking a node and submitting change the graph. The other controls are read
+        # as state, so changing them does not make a round trip to the server.
         [
             # Input related to interactive network functionality
-            Input(component_id="network_visualization", component_property="data"),
             Input(component_id="network_visualization", component_property="selection"),
-            Input(component_id="graph_interaction_input", component_property="value"),
-            # Input related to node search id and neighborhood expantion
-            Input(component_id="search_node_id_input", component_property="value"),
-            Input(component_id="expand_num_hops_input", component_property="value"),
-            # Input related to network filtering
-            Input(component_id="filter_node_type_input", component_property="value"),
-            Input(
+            # Input related to the submit button
+            Input(component_id="submit_button", component_property="n_clicks"),
+        ],
+        [
+            State(component_id="graph_interaction_input", component_property="value"),
+            # State related to node search id and neighborhood expantion
+            State(component_id="search_node_id_input", component_property="value"),
+            State(component_id="path_target_node_id_input", component_property="value"),
+            State(component_id="expand_num_hops_input", component_property="value"),
+            # State related to network filtering
+            State(component_id="filter_node_type_input", component_property="value"),
+            State(
                 component_id="filter_node_screentime_input_input",
                 component_property="value",
             ),
-            Input(
+            State(
+                component_id="filter_centrality_metric_input",
+                component_property="value",
+            ),
+            State(
+                component_id="filter_centrality_input_input",
+                component_property="value",
+            ),
+            State(
                 component_id="filter_edge_weight_input_input",
                 component_property="value",
             ),
-            # Input related to the submit button
-            Input(component_id="submit_button", component_property="n_clicks"),
+            State(component_id="node_size_metric_input", component_property="value"),
+            State(component_id="session_id", component_property="data"),
+            State(component_id="network_revision", component_property="data"),
         ],
+        prevent_initial_call=True,
     )
     def callback_network_visualization(
-        graph_data,
         clicked_node,
+        n_clicks,
         interaction_value,
         search_node_id,
+        path_target_node_id,
         num_hops,
         filter_node_types,
         filter_node_screentime,
+        filter_centrality_metric,
+        filter_centrality_percentile,
         filter_edge_weight,
-        n_clicks,
+        node_size_metric,
+        session_id,
+        network_revision,
     ):
         triggered_id = dash.callback_context.triggered_id
         clicked_node = resolve_clicked_node(clicked_node)
         num_hops = resolve_num_hops(num_hops)
 
         if triggered_id not in ("submit_button", "network_visualization"):
-            return graph_data
-        elif triggered_id == "submit_button":
-            filter_params = GraphFilterParams(
-                filter_node_screentime,
-                filter_edge_weight,
-                filter_node_types,
-            )
-            data.update_filter(filter_params)
-            data.graph_display = data.graph_filtered.get_neighborhood_around_node(
-                search_node_id, num_hops
-            )
-        elif triggered_id == "network_visualization":
-            if interaction_value == "expand_node":
-                node_egonet = data.graph_filtered.get_neighborhood_around_node(
-                    clicked_node, 1
+            return dash.no_update, dash.no_update, dash.no_update
+        # Paths are shown from the searched node
+        is_graph_interaction = (
+            triggered_id == "network_visualization"
+            and clicked_node is not None
+            and interaction_value in GRAPH_INTERACTIONS
+            and (interaction_value != "show_path" or search_node_id is not None)
+        )
+
+        with session_store.use(session_id) as (data, is_new_session):
+            if triggered_id == "network_visualization" and not (
+                is_graph_interaction or is_new_session
+            ):
+                return dash.no_update, dash.no_update, dash.no_update
+
+            # A new session, e.g. one that was evicted from session_store, does not know what
+            # the client shows, so it is rebuilt from the controls and rendered in full
+            if triggered_id == "submit_button" or is_new_session:
+                filter_params = GraphFilterParams(
+                    filter_node_screentime,
+                    filter_edge_weight,
+                    filter_node_types,
+                    filter_centrality_metric,
+                    filter_centrality_percentile,
                 )
-                data.add_subgraph_to_displaygraph(node_egonet)
-            elif interaction_value == "delete_node":
-                data.delete_node_from_display_graph(clicked_node)
+                data.update_filter(filter_params)
+                data.set_node_size_metric(node_size_metric)
+                if path_target_node_id is not None:
+                    data.set_display_graph(
+                        data.get_shortest_path_neighborhood(
+                            search_node_id, path_target_node_id
+                        )
+                    )
+                else:
+                    data.set_display_graph(
+                        data.get_neighborhood_around_node(search_node_id, num_hops)
+                    )
 
-        return data.create_visddc_network()
+            if is_graph_interaction:
+                if interaction_value == "expand_node":
+                    node_egonet = data.get_neighborhood_around_node(clicked_node, 1)
+                    data.add_subgraph_to_displaygraph(node_egonet)
+                elif interaction_value == "delete_node":
+                    data.delete_node_from_display_graph(clicked_node)
+                elif interaction_value == "expand_community":
+                    data.expand_community(clicked_node)
+                elif interaction_value == "show_path":
+                    path_neighborhood = data.get_shortest_path_neighborhood(
+                        search_node_id, clicked_node
+                    )
+                    data.add_subgraph_to_displaygraph(path_neighborhood)
+
+            # Node interactions only change a few nodes, so only the changes are sent,
+            # unless communities are shown
+            if is_graph_interaction and not is_new_session:
+                network_update = data.create_visdcc_network_update()
+                if network_update is not None:
+                    if not any(network_update.values()):
+                        return dash.no_update, dash.no_update, dash.no_update
+                    return (
+                        dash.no_update,
+                        create_javascript_for_network_update(network_update),
+                        network_revision + 1,
+                    )
+
+            return data.create_visddc_network(), dash.no_update, network_revision + 1
 
 
 def callback_sync_screentime_input(app):
-    @app.callback(
+    app.clientside_callback(
+        create_javascript_for_value_sync(
+            "filter_node_screentime_slider_input", "filter_node_screentime_input_input"
+        ),
         [
             Output(
                 component_id="filter_node_screentime_slider_input",
@@ -131,21 +276,41 @@ def callback_sync_screentime_input(app):
             ),
         ],
     )
-    def callback_screentime_input(
-        slider_value,
-        input_value,
-    ):
-        triggered_id = dash.callback_context.triggered_id
-        if triggered_id == "filter_node_screentime_slider_input":
-            return [slider_value, slider_value]
-        elif triggered_id == "filter_node_screentime_input_input":
-            return [input_value, input_value]
-        else:
-            return [slider_value, input_value]
+
+
+def callback_sync_centrality_input(app):
+    app.clientside_callback(
+        create_javascript_for_value_sync(
+            "filter_centrality_slider_input", "filter_centrality_input_input"
+        ),
+        [
+            Output(
+                component_id="filter_centrality_slider_input",
+                component_property="value",
+            ),
+            Output(
+                component_id="filter_centrality_input_input",
+                component_property="value",
+            ),
+        ],
+        [
+            Input(
+                component_id="filter_centrality_slider_input",
+                component_property="value",
+            ),
+            Input(
+                component_id="filter_centrality_input_input",
+                component_property="value",
+            ),
+        ],
+    )
 
 
 def callback_sync_edge_weight_input(app):
-    @app.callback(
+    app.clientside_callback(
+        create_javascript_for_value_sync(
+            "filter_edge_weight_slider_input", "filter_edge_weight_input_input"
+        ),
         [
             Output(
                 component_id="filter_edge_weight_slider_input",
@@ -167,30 +332,30 @@ def callback_sync_edge_weight_input(app):
             ),
         ],
     )
-    def callback_edge_weight_input(
-        slider_value,
-        input_value,
-    ):
-        triggered_id = dash.callback_context.triggered_id
-        if triggered_id == "filter_edge_weight_slider_input":
-            return [slider_value, slider_value]
-        elif triggered_id == "filter_edge_weight_input_input":
-            return [input_value, input_value]
-        else:
-            return [slider_value, input_value]
+
+
+def callback_search_node_options(app, dropdown_id):
+    @app.callback(
+        Output(component_id=dropdown_id, component_property="options"),
+        Input(component_id=dropdown_id, component_property="search_value"),
+        State(component_id=dropdown_id, component_property="value"),
+        prevent_initial_call=True,
+    )
+    def callback_search_node_options(search_value, value):
+        return shared_data.get_options_for_dropdown(search_value, value)
 
 
 def callback_graph_summary_table(app):
     @app.callback(
         Output(component_id="graph_summary_table_table", component_property="data"),
         [
-            Input(component_id="network_visualization", component_property="data"),
+            Input(component_id="network_revision", component_property="data"),
         ],
+        State(component_id="session_id", component_property="data"),
     )
-    def callback_graph_summary_table(_):
-        graph_summary_table = data.graph_display.graph_summary_table.to_dict("records")
-
-        graph_summary_table = data.create_datatable_to_display()
+    def callback_graph_summary_table(_, session_id):
+        with session_store.use(session_id) as (data, _):
+            graph_summary_table = data.create_datatable_to_display()
 
         return graph_summary_table
 
@@ -201,22 +366,33 @@ def callback_open_url_on_node_click(app):
         [
             # Input related to interactive network functionality
             Input(component_id="network_visualization", component_property="selection"),
-            Input(component_id="graph_interaction_input", component_property="value"),
         ],
+        State(component_id="graph_interaction_input", component_property="value"),
     )
     def callback_open_url_on_node_click(
         clicked_node,
         interaction_value,
     ):
+        # run is also written by callback_network_visualization, so it is only written here
+        # when a page is opened
         triggered_id = dash.callback_context.triggered_id
-        return create_javascript_for_character_url(
+        javascript = create_javascript_for_character_url(
             triggered_id, interaction_value, clicked_node
         )
+        if javascript is None:
+            return dash.no_update
+        return javascript
+
 
+def register_callbacks(app, callback_metrics=None):
+    if callback_metrics is not None:
+        app = callback_metrics.instrument_app(app)
 
-def register_callbacks(app):
     callback_network_visualization(app)
     callback_sync_screentime_input(app)
+    callback_sync_centrality_input(app)
     callback_sync_edge_weight_input(app)
+    callback_search_node_options(app, "search_node_id_input")
+    callback_search_node_options(app, "path_target_node_id_input")
     callback_graph_summary_table(app)
     callback_open_url_on_node_click(app)
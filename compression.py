@@ -0,0 +1,40 @@
+import gzip
+import flask
+
+# Images are compressed already, so only text responses are compressed
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+}
+COMPRESSION_LEVEL = 6
+
+
+def register_response_compression(server, min_bytes):
+    """
+    Gzip the text responses of the flask server of the app of at least min_bytes, e.g. the
+    network payloads of the callbacks, for clients that accept it
+    """
+
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "gzip" not in flask.request.headers.get("Accept-Encoding", "").lower()
+        ):
+            return response
+
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(gzip.compress(data, COMPRESSION_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    server.after_request(compress_response)
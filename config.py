@@ -3,4 +3,65 @@ import os
 DATA_PATH = os.path.join(os.getcwd(), "data")
 NODE_PATH = os.path.join(DATA_PATH, "raw_data/got_nodes.csv")
 EDGE_PATH = os.path.join(DATA_PATH, "raw_data/got_edges.csv")
+CACHE_PATH = os.path.join(DATA_PATH, "cache")
+# NODE_PATH and EDGE_PATH can also be .parquet or .arrow/.feather files, which need pyarrow.
+# They are read in chunks of this many rows.
+LOAD_CHUNK_SIZE = 1_000_000
 FILE_PATH_FOR_IMAGES = "assets/portrait_images"
+# Shown for characters without a portrait
+PORTRAIT_FALLBACK_PATH = "assets/portrait_fallback.svg"
+# Square portrait thumbnails in these sizes in pixels, covering the node sizes of
+# DFGraph.get_node_size, see download_portraits.create_thumbnails. Portraits are cropped to
+# this fraction of their height first.
+PORTRAIT_THUMBNAIL_DIRECTORY = "assets/portrait_thumbnails"
+PORTRAIT_THUMBNAIL_SIZES = (80, 140, 200)
+PORTRAIT_CROP_FRACTION = 0.7
+
+# Server side session store, see data/session_store.py
+SESSION_MAX_COUNT = 100
+SESSION_MAX_BYTES = 512 * 1024**2
+SESSION_TTL_SECONDS = 60 * 60
+
+# How often the portrait directory is checked for new portraits, see data/portraits.py
+PORTRAIT_WATCH_INTERVAL_SECONDS = 10
+
+# Portrait scraper, see download_portraits.py. The download state is kept so interrupted
+# runs resume.
+PORTRAIT_WIKI_BASE_URL = "https://gameofthrones.fandom.com"
+PORTRAIT_STATE_PATH = os.path.join(DATA_PATH, "portrait_download_state.json")
+PORTRAIT_DOWNLOAD_WORKERS = 8
+PORTRAIT_REQUESTS_PER_SECOND_PER_HOST = 4
+PORTRAIT_DOWNLOAD_RETRIES = 4
+PORTRAIT_DOWNLOAD_TIMEOUT_SECONDS = 10
+
+# Opt-in callback instrumentation served on /metrics, see instrumentation.py
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION_ENABLED", "0") == "1"
+SLOW_CALLBACK_THRESHOLD_SECONDS = 1.0
+
+# Text responses of at least this many bytes, e.g. network payloads, are gzip compressed for
+# clients that accept it, see compression.py. 0 disables compression.
+RESPONSE_COMPRESSION_MIN_BYTES = int(
+    os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", 1024)
+)
+
+# Displayed graphs with more nodes than this are shown as communities, see data/communities.py
+COMMUNITY_AGGREGATION_MIN_NODES = 300
+
+# Filtered graphs shared between sessions, see data/result_cache.py
+FILTER_CACHE_MAX_ENTRIES = 16
+FILTER_CACHE_MAX_BYTES = 256 * 1024**2
+
+# Node search of the node dropdowns, see data/node_search.py. Matches are ranked by
+# "screentime" or a centrality metric, e.g. "weighted_degree", and at most this many are sent.
+# Names that are not prefix matches need this share of the trigrams of the search.
+NODE_SEARCH_RANKING = "screentime"
+NODE_SEARCH_MAX_RESULTS = 50
+NODE_SEARCH_MIN_SIMILARITY = 0.5
+
+# Neighborhood queries shared between sessions, see GraphData.get_neighborhood_around_node.
+# At startup the 1 and 2 hop neighborhoods of this many nodes with the highest "degree",
+# "screentime" or centrality metric, e.g. "pagerank", are computed, 0 to skip this.
+NEIGHBORHOOD_CACHE_MAX_ENTRIES = 1000
+NEIGHBORHOOD_CACHE_MAX_BYTES = 256 * 1024**2
+NEIGHBORHOOD_CACHE_WARM_UP_NODES = 25
+NEIGHBORHOOD_CACHE_WARM_UP_RANKING = "degree"
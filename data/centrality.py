@@ -0,0 +1,225 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from .dfgraph import DFGraph, NODE_SIZE_MIN, NODE_SIZE_MAX
+from .utils import calculate_slope, concatenate_ranges
+
+# Metric names and their labels in the dashboard
+CENTRALITY_METRICS = {
+    "weighted_degree": "Weighted Degree",
+    "pagerank": "PageRank",
+    "betweenness": "Betweenness",
+}
+DEFAULT_CENTRALITY_METRIC = "pagerank"
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-6
+# Betweenness is estimated from the shortest paths from as many random nodes as fit in this
+# many visits of an edge, but at least BETWEENNESS_MIN_SAMPLES. It is exact for small graphs.
+BETWEENNESS_EDGE_VISITS = 20_000_000
+BETWEENNESS_MIN_SAMPLES = 32
+# Identifies the results of compute_centrality in load_cached_arrays. Increment the number
+# when the computation changes.
+CENTRALITY_VERSION = (
+    1,
+    list(CENTRALITY_METRICS),
+    PAGERANK_DAMPING,
+    PAGERANK_MAX_ITERATIONS,
+    PAGERANK_TOLERANCE,
+    BETWEENNESS_EDGE_VISITS,
+    BETWEENNESS_MIN_SAMPLES,
+)
+
+
+def compute_weighted_degree(from_rows, to_rows, weights, num_nodes):
+    """
+    Summed weight of the edges of each node
+    """
+    return np.bincount(from_rows, weights=weights, minlength=num_nodes) + np.bincount(
+        to_rows, weights=weights, minlength=num_nodes
+    )
+
+
+def compute_pagerank(from_rows, to_rows, weights, num_nodes):
+    """
+    PageRank of each node by power iteration, where every edge is followed in both directions
+    with a probability proportional to its weight. Each iteration is one sparse matrix-vector
+    product, done with bincount over the edges. The rank of nodes without edges is spread
+    over all nodes.
+    """
+    if num_nodes == 0:
+        return np.zeros(0)
+    sources = np.concatenate([from_rows, to_rows])
+    targets = np.concatenate([to_rows, from_rows])
+    weights = np.concatenate([weights, weights])
+    strength = np.bincount(sources, weights=weights, minlength=num_nodes)
+    is_dangling = strength == 0
+    transition = weights / np.where(is_dangling, 1, strength)[sources]
+
+    rank = np.full(num_nodes, 1 / num_nodes)
+    for _ in range(PAGERANK_MAX_ITERATIONS):
+        new_rank = np.bincount(
+            targets, weights=rank[sources] * transition, minlength=num_nodes
+        )
+        new_rank = PAGERANK_DAMPING * (new_rank + rank[is_dangling].sum() / num_nodes)
+        new_rank += (1 - PAGERANK_DAMPING) / num_nodes
+        is_converged = np.abs(new_rank - rank).sum() < PAGERANK_TOLERANCE
+        rank = new_rank
+        if is_converged:
+            break
+    return rank
+
+
+def compute_betweenness(from_rows, to_rows, num_nodes, seed=0):
+    """
+    Approximate betweenness of each node, by Brandes' algorithm from a sample of random source
+    nodes, scaled to all sources, see BETWEENNESS_EDGE_VISITS. Shortest paths are counted in
+    hops, so each source is a breadth first search over a CSR adjacency index, vectorized per
+    level.
+    """
+    betweenness = np.zeros(num_nodes)
+    if num_nodes == 0:
+        return betweenness
+
+    # Parallel edges would count paths twice, so every pair of nodes is listed once
+    low = np.minimum(from_rows, to_rows).astype(np.int64)
+    high = np.maximum(from_rows, to_rows).astype(np.int64)
+    keys = np.unique(low[low != high] * num_nodes + high[low != high])
+    low, high = keys // num_nodes, keys % num_nodes
+    sources = np.concatenate([low, high])
+    order = np.argsort(sources, kind="stable")
+    neighbors = np.concatenate([high, low])[order]
+    offsets = np.concatenate(
+        [[0], np.cumsum(np.bincount(sources, minlength=num_nodes))]
+    )
+
+    # Each sample visits every edge in both directions
+    num_samples = max(
+        BETWEENNESS_EDGE_VISITS // max(len(neighbors), 1), BETWEENNESS_MIN_SAMPLES
+    )
+    rng = np.random.default_rng(seed)
+    samples = rng.choice(num_nodes, min(num_samples, num_nodes), replace=False)
+    for sample in samples:
+        distances = np.full(num_nodes, -1)
+        distances[sample] = 0
+        # Number of shortest paths from the sample to each node
+        path_counts = np.zeros(num_nodes)
+        path_counts[sample] = 1
+        # The edges from each level to the next on shortest paths, as (parents, children)
+        levels = []
+        frontier = np.array([sample])
+        level = 0
+        while frontier.size > 0:
+            level += 1
+            counts = offsets[frontier + 1] - offsets[frontier]
+            parents = np.repeat(frontier, counts)
+            children = neighbors[
+                concatenate_ranges(offsets[frontier], offsets[frontier + 1])
+            ]
+            is_new = distances[children] == -1
+            distances[children[is_new]] = level
+            is_shortest = distances[children] == level
+            parents, children = parents[is_shortest], children[is_shortest]
+            path_counts += np.bincount(
+                children, weights=path_counts[parents], minlength=num_nodes
+            )
+            levels.append((parents, children))
+            frontier = np.flatnonzero(distances == level)
+
+        # Dependencies are accumulated from the last level back to the sample
+        dependencies = np.zeros(num_nodes)
+        for parents, children in reversed(levels):
+            dependencies += np.bincount(
+                parents,
+                weights=path_counts[parents]
+                / path_counts[children]
+                * (1 + dependencies[children]),
+                minlength=num_nodes,
+            )
+        dependencies[sample] = 0
+        betweenness += dependencies
+
+    # Every path of the undirected graph is found from both of its ends
+    return betweenness * num_nodes / len(samples) / 2
+
+
+def compute_centrality(graph: DFGraph, num_node_ids):
+    """
+    The arrays of a NodeCentrality of graph by metric of CENTRALITY_METRICS, indexed by node id
+    and NaN for node ids that are not nodes of the graph
+    """
+    node_ids = graph.nodes["id"].to_numpy()
+    node_rows = pd.Index(node_ids)
+    from_rows = node_rows.get_indexer(graph.edges["from"])
+    to_rows = node_rows.get_indexer(graph.edges["to"])
+    is_valid = (from_rows >= 0) & (to_rows >= 0)
+    from_rows = from_rows[is_valid]
+    to_rows = to_rows[is_valid]
+    weights = graph.edges["weight"].to_numpy(dtype=np.float64)[is_valid]
+    num_nodes = len(node_ids)
+
+    metrics = {
+        "weighted_degree": compute_weighted_degree(
+            from_rows, to_rows, weights, num_nodes
+        ),
+        "pagerank": compute_pagerank(from_rows, to_rows, weights, num_nodes),
+        "betweenness": compute_betweenness(from_rows, to_rows, num_nodes),
+    }
+    arrays = {}
+    for metric, values in metrics.items():
+        arrays[metric] = np.full(num_node_ids, np.nan)
+        arrays[metric][node_ids] = values
+    return arrays
+
+
+@dataclass
+class NodeCentrality:
+    """
+    Centrality metrics of the nodes of a graph, from compute_centrality. The metrics are
+    heavy-tailed, so nodes are filtered and sized by their percentile: the percentage of
+    nodes with a smaller value.
+    """
+
+    # values[metric][node_id] and percentiles[metric][node_id], NaN for node ids that are not
+    # nodes of the graph
+    values: dict
+    percentiles: dict
+
+    def __init__(self, arrays):
+        self.values = {metric: arrays[metric] for metric in CENTRALITY_METRICS}
+        self.percentiles = {}
+        for metric, values in self.values.items():
+            is_node = ~np.isnan(values)
+            sorted_values = np.sort(values[is_node])
+            percentiles = np.full(len(values), np.nan)
+            percentiles[is_node] = (
+                100
+                * np.searchsorted(sorted_values, values[is_node])
+                / max(len(sorted_values), 1)
+            )
+            self.percentiles[metric] = percentiles
+
+    def memory_usage(self):
+        return sum(values.nbytes for values in self.values.values()) + sum(
+            percentiles.nbytes for percentiles in self.percentiles.values()
+        )
+
+    def get_percentiles(self, metric, node_ids):
+        return self.percentiles[metric][np.asarray(node_ids)]
+
+    def get_node_size(self, metric, node_ids):
+        """
+        We scale the nodes linearly in the percentile of the metric, on the scale of
+        DFGraph.get_node_size
+        """
+        slope = calculate_slope(0, 100, NODE_SIZE_MIN, NODE_SIZE_MAX)
+        return slope * self.get_percentiles(metric, node_ids) + NODE_SIZE_MIN
+
+    def get_top_node_ids(self, metric, num_nodes):
+        """
+        Node ids of the num_nodes nodes with the largest value of the metric
+        """
+        values = self.values[metric]
+        node_ids = np.flatnonzero(~np.isnan(values))
+        order = np.argsort(-values[node_ids], kind="stable")
+        return node_ids[order[:num_nodes]]
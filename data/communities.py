@@ -0,0 +1,223 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from .dfgraph import DFGraph
+
+COMMUNITY_LEVELS = 3
+LABEL_PROPAGATION_ITERATIONS = 30
+# Identifies the results of compute_community_labels in load_cached_arrays. Increment the
+# number when the algorithm changes.
+COMMUNITY_LABELS_VERSION = (1, COMMUNITY_LEVELS, LABEL_PROPAGATION_ITERATIONS)
+COMMUNITY_NAME_PREFIX = "community"
+
+
+def label_propagation(from_rows, to_rows, weights, num_nodes, seed=0):
+    """
+    Community label of each node by weighted label propagation, vectorized over all edges.
+    Every node starts in its own community and repeatedly takes the label with the largest
+    total edge weight among its neighbors, ties broken by a fixed random priority of the
+    labels. A random half of the nodes is updated at a time, since updating all nodes at once
+    can oscillate. Returns labels numbered 0, 1, ...
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(num_nodes)
+    priority = rng.random(num_nodes)
+
+    sources = np.concatenate([from_rows, to_rows]).astype(np.int64)
+    targets = np.concatenate([to_rows, from_rows])
+    weights = np.concatenate([weights, weights]).astype(np.float64)
+
+    for _ in range(LABEL_PROPAGATION_ITERATIONS):
+        # Total weight from each node to each label among its neighbors
+        keys = sources * num_nodes + labels[targets]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=weights)
+        key_nodes = unique_keys // num_nodes
+        key_labels = unique_keys % num_nodes
+
+        # unique_keys are sorted by node, so the keys of each node are contiguous. The best
+        # label of a node has its largest total, and of those the highest priority.
+        group_starts = np.flatnonzero(np.diff(key_nodes, prepend=-1))
+        group_sizes = np.diff(np.append(group_starts, len(key_nodes)))
+        max_totals = np.repeat(np.maximum.reduceat(totals, group_starts), group_sizes)
+        scores = np.where(totals == max_totals, priority[key_labels], -1.0)
+        max_scores = np.repeat(np.maximum.reduceat(scores, group_starts), group_sizes)
+        is_best = scores == max_scores
+        best_labels = labels.copy()
+        best_labels[key_nodes[is_best]] = key_labels[is_best]
+
+        is_changed = best_labels != labels
+        if not is_changed.any():
+            break
+        is_updated = is_changed & (rng.random(num_nodes) < 0.5)
+        labels[is_updated] = best_labels[is_updated]
+
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels.ravel()
+
+
+def _aggregate_edges(from_rows, to_rows, weights, labels):
+    """
+    Edges between the communities given by labels, with the summed weight of the edges
+    between their members. Edges within a community are dropped.
+    """
+    from_labels = labels[from_rows]
+    to_labels = labels[to_rows]
+    is_between = from_labels != to_labels
+    low = np.minimum(from_labels, to_labels)[is_between].astype(np.int64)
+    high = np.maximum(from_labels, to_labels)[is_between].astype(np.int64)
+
+    keys, inverse = np.unique(low * (labels.max() + 1) + high, return_inverse=True)
+    summed_weights = np.bincount(inverse.ravel(), weights=weights[is_between])
+    return keys // (labels.max() + 1), keys % (labels.max() + 1), summed_weights
+
+
+def compute_community_labels(graph: DFGraph, num_node_ids):
+    """
+    The labels of a CommunityHierarchy of graph. Level 1 are communities of nodes found by
+    label propagation, and each next level are communities of the communities of the level
+    below, found by label propagation on the graph of aggregated edges between them. Levels
+    that merge less than a tenth of the communities of the level below are left out.
+    """
+    node_ids = graph.nodes["id"].to_numpy()
+    node_rows = pd.Index(node_ids)
+    from_rows = node_rows.get_indexer(graph.edges["from"])
+    to_rows = node_rows.get_indexer(graph.edges["to"])
+    is_valid = (from_rows >= 0) & (to_rows >= 0)
+    from_rows = from_rows[is_valid]
+    to_rows = to_rows[is_valid]
+    weights = graph.edges["weight"].to_numpy(dtype=np.float64)[is_valid]
+
+    levels = []
+    # Community of each node row at the current level
+    row_labels = np.arange(len(node_ids))
+    num_communities = len(node_ids)
+    for _ in range(COMMUNITY_LEVELS):
+        community_labels = label_propagation(
+            from_rows, to_rows, weights, num_communities
+        )
+        num_merged_communities = community_labels.max(initial=-1) + 1
+        if num_merged_communities > 0.9 * num_communities:
+            break
+        row_labels = community_labels[row_labels]
+        num_communities = num_merged_communities
+
+        labels = np.full(num_node_ids, -1, dtype=np.int32)
+        labels[node_ids] = row_labels
+        levels.append(labels)
+
+        from_rows, to_rows, weights = _aggregate_edges(
+            from_rows, to_rows, weights, community_labels
+        )
+    return levels
+
+
+@dataclass
+class CommunityHierarchy:
+    """
+    Communities of a graph at several levels of detail, from compute_community_labels.
+    Communities are shown as single nodes, with negative node ids from get_community_node_ids
+    so they do not collide with the node ids of StringTable codes.
+    """
+
+    # labels[level - 1][node_id] is the community of the node at the level, -1 for node ids
+    # that are not nodes of the graph
+    labels: list
+    num_node_ids: int
+
+    def __init__(self, labels, num_node_ids):
+        self.labels = labels
+        self.num_node_ids = num_node_ids
+
+    @property
+    def num_levels(self):
+        return len(self.labels)
+
+    def memory_usage(self):
+        return sum(labels.nbytes for labels in self.labels)
+
+    def get_community_node_ids(self, level, node_ids):
+        """
+        Node id of the community at level of each of node_ids
+        """
+        labels = self.labels[level - 1][node_ids].astype(np.int64)
+        return (-1 - ((level - 1) * self.num_node_ids + labels)).astype(np.int32)
+
+    def parse_community_node_id(self, community_node_id):
+        """
+        The level and label of a node id from get_community_node_ids
+        """
+        level, label = divmod(-1 - int(community_node_id), self.num_node_ids)
+        return level + 1, label
+
+    def get_community_names(self, community_node_ids):
+        names = []
+        for community_node_id in community_node_ids:
+            level, label = self.parse_community_node_id(community_node_id)
+            names.append(f"{COMMUNITY_NAME_PREFIX}-{level}-{label}")
+        return np.array(names, dtype=object)
+
+    def get_community_node_id(self, community_name):
+        """
+        Node id of the community with the name from get_community_names, None if community_name
+        is not the name of a community
+        """
+        if not isinstance(community_name, str):
+            return None
+        parts = community_name.split("-")
+        if (
+            len(parts) != 3
+            or parts[0] != COMMUNITY_NAME_PREFIX
+            or not (parts[1].isdecimal() and parts[2].isdecimal())
+        ):
+            return None
+        level, label = int(parts[1]), int(parts[2])
+        return int(-1 - ((level - 1) * self.num_node_ids + label))
+
+    def get_node_representatives(self, node_ids, collapsed_communities):
+        """
+        The node id each node is shown as: the id of its collapsed community if it is in one
+        of collapsed_communities, otherwise its own id
+        """
+        representatives = np.asarray(node_ids, dtype=np.int32).copy()
+        for level in range(1, self.num_levels + 1):
+            community_node_ids = self.get_community_node_ids(level, node_ids)
+            is_collapsed = np.isin(community_node_ids, list(collapsed_communities))
+            representatives[is_collapsed] = community_node_ids[is_collapsed]
+        return representatives
+
+
+def aggregate_graph(graph: DFGraph, representatives):
+    """
+    The graph with every node replaced by its representative, given per row of graph.nodes.
+    Nodes with the same representative become one node with their summed screentime and their
+    number of members in the column members, keeping the gender of the member with the most
+    screentime. Edges between the same two nodes are merged into one with their summed
+    weight, and edges within a node are dropped.
+    """
+    nodes = graph.nodes.assign(id=representatives, members=1)
+    nodes = nodes.groupby("id", sort=False, observed=True).agg(
+        gender=("gender", "first"),
+        screentime=("screentime", "sum"),
+        members=("members", "sum"),
+    )
+    nodes = nodes.reset_index().sort_values(by="screentime", ascending=False)
+
+    node_representatives = pd.Series(
+        representatives, index=graph.nodes["id"].to_numpy()
+    )
+    from_ids = node_representatives.reindex(graph.edges["from"].to_numpy()).to_numpy()
+    to_ids = node_representatives.reindex(graph.edges["to"].to_numpy()).to_numpy()
+    edges = pd.DataFrame(
+        {
+            "from": np.fmin(from_ids, to_ids),
+            "to": np.fmax(from_ids, to_ids),
+            "weight": graph.edges["weight"].to_numpy(),
+        }
+    )
+    edges = edges[edges["from"] != edges["to"]].dropna(subset=["from", "to"])
+    edges = edges.astype({"from": np.int32, "to": np.int32})
+    edges = edges.groupby(["from", "to"], sort=False).agg(weight=("weight", "sum"))
+    edges = edges.reset_index().sort_values(by="weight", ascending=False)
+
+    return DFGraph.from_sorted_frames(nodes, edges)
@@ -1,20 +1,47 @@
+from copy import copy
+import heapq
 from dataclasses import dataclass
+import numpy as np
 import pandas as pd
-from .utils import calculate_slope, GraphFilterParams
+from .graph_summary import GraphSummary
+from .utils import calculate_slope, concatenate_ranges, GraphFilterParams
+
+# Radius of the nodes, see get_node_size
+NODE_SIZE_MIN = 20
+NODE_SIZE_MAX = 50
 
 
 @dataclass
 class DFGraph:
+    """
+    A graph held in two frames, in the compact representation of load_data.create_compact_frames:
+    nodes has columns id (int32), gender (categorical) and screentime (float64), and edges has
+    columns from and to (int32 node ids) and weight (float32).
+    The int32 node ids are codes into the StringTable GraphData.node_names.
+    """
+
     nodes: pd.DataFrame
     edges: pd.DataFrame
 
-    graph_summary_table: pd.DataFrame
+    # Built by get_graph_summary, only for graphs that are displayed
+    graph_summary: GraphSummary
 
     screentime_min: float
     screentime_max: float
     edge_weight_min: float
     edge_weight_max: float
 
+    # CSR adjacency index, see _build_adjacency_index
+    node_positions: dict
+    adjacency_offsets: np.ndarray
+    adjacency_neighbors: np.ndarray
+    adjacency_edges: np.ndarray
+    adjacency_distances: np.ndarray
+
+    # Hash sets of node ids and canonical edge keys, see _build_dedup_index
+    node_id_set: set
+    edge_key_set: set
+
     def __init__(self, nodes=None, edges=None):
         if nodes is not None and edges is not None:
             self.nodes = nodes
@@ -29,23 +56,28 @@ class DFGraph:
             self.edge_weight_min = 0
             self.edge_weight_max = 0
 
-            self.graph_summary_table = pd.DataFrame(
-                columns=["Field Description", "Value"]
-            )
+            self.graph_summary = None
+
+            self.node_positions = {}
+            self.adjacency_offsets = np.zeros(1, dtype=np.int64)
+            self.adjacency_neighbors = np.zeros(0, dtype=np.int64)
+            self.adjacency_edges = np.zeros(0, dtype=np.int64)
+            self.adjacency_distances = np.zeros(0, dtype=np.float64)
+
+            self.node_id_set = None
+            self.edge_key_set = None
 
     def get_node_size(self, screentime):
         """
-        We scale the nodes linearly in s (screentime) from node_size_min to node_size_max
+        We scale the nodes linearly in s (screentime) from NODE_SIZE_MIN to NODE_SIZE_MAX
         """
-        node_size_min = 20
-        node_size_max = 50
         slope = calculate_slope(
             self.screentime_min,
             self.screentime_max,
-            node_size_min,
-            node_size_max,
+            NODE_SIZE_MIN,
+            NODE_SIZE_MAX,
         )
-        node_size = slope * (screentime - self.screentime_min) + node_size_min
+        node_size = slope * (screentime - self.screentime_min) + NODE_SIZE_MIN
         return node_size
 
     def get_edge_width(self, edge_weight):
@@ -76,48 +108,338 @@ class DFGraph:
             .reset_index(drop=True)
         )
 
+        self._update_derived_attributes()
+
+    @classmethod
+    def from_sorted_frames(cls, nodes, edges):
+        """
+        Create a graph from frames that are already free of duplicates and sorted the way
+        update_graph sorts them, e.g. row subsets of another DFGraph. Skips the sorting.
+        """
+        graph = cls()
+        graph.nodes = nodes.reset_index(drop=True)
+        graph.edges = edges.reset_index(drop=True)
+        graph._update_derived_attributes()
+        return graph
+
+    def copy(self):
+        """
+        A copy that can be modified without modifying self. The frames and index arrays are
+        shared, since they are replaced rather than modified in place.
+        """
+        graph = copy(self)
+        if self.graph_summary is not None:
+            graph.graph_summary = self.graph_summary.copy()
+        graph.node_id_set = None
+        graph.edge_key_set = None
+        return graph
+
+    def get_graph_summary(self):
+        """
+        The GraphSummary of the graph. It is built on first use and then kept up to date by
+        append_graph and delete_nodes_from_graph.
+        """
+        if self.graph_summary is None and self.nodes is not None:
+            self.graph_summary = GraphSummary(self.nodes, self.edges)
+        return self.graph_summary
+
+    def _update_derived_attributes(self):
         self.screentime_min = self.nodes["screentime"].min()
         self.screentime_max = self.nodes["screentime"].max()
 
         self.edge_weight_min = self.edges["weight"].min()
         self.edge_weight_max = self.edges["weight"].max()
 
-        self.create_graph_summary_table()
+        self.graph_summary = None
+        self._build_adjacency_index()
+
+        self.node_id_set = None
+        self.edge_key_set = None
+
+    def _build_adjacency_index(self):
+        """
+        Map every node id to an integer position and build a CSR index over the edges:
+        the neighbors of the node at position p are
+        adjacency_neighbors[adjacency_offsets[p] : adjacency_offsets[p + 1]], and
+        adjacency_edges holds the row of self.edges connecting them, and adjacency_distances
+        their distance in get_shortest_path.
+        Node ids in self.nodes get positions 0..len(self.nodes)-1, equal to their row number.
+        Ids that only appear in edges are placed after them.
+        """
+        num_edges = self.edges.shape[0]
+        ids = np.concatenate(
+            [
+                self.nodes["id"].to_numpy(),
+                self.edges["from"].to_numpy(),
+                self.edges["to"].to_numpy(),
+            ]
+        )
+        codes, unique_ids = pd.factorize(ids, use_na_sentinel=False)
+        edge_codes = codes[self.nodes.shape[0] :]
+
+        # Edges are undirected, so each edge is listed under both of its endpoints
+        sources = edge_codes
+        neighbors = np.concatenate([edge_codes[num_edges:], edge_codes[:num_edges]])
+        edge_rows = np.tile(np.arange(num_edges), 2)
+
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(sources, minlength=len(unique_ids))
+
+        self.node_positions = {node_id: i for i, node_id in enumerate(unique_ids)}
+        self.adjacency_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.adjacency_neighbors = neighbors[order]
+        self.adjacency_edges = edge_rows[order]
+
+        # Heavier edges are closer. Edges without a positive weight are never traversed.
+        weights = self.edges["weight"].to_numpy(dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            distances = np.where(weights > 0, 1 / weights, np.inf)
+        self.adjacency_distances = distances[self.adjacency_edges]
+
+    @staticmethod
+    def _get_edge_keys(edges):
+        """
+        One int64 per edge, combining its node ids in ascending order, so that an edge has the
+        same key in both directions
+        """
+        from_ids = edges["from"].to_numpy().astype(np.int64)
+        to_ids = edges["to"].to_numpy().astype(np.int64)
+        return (np.minimum(from_ids, to_ids) << 32) | np.maximum(from_ids, to_ids)
+
+    def _build_dedup_index(self):
+        """
+        Hash sets used by append_graph to find the rows it does not already have. They are only
+        built for graphs that are appended to.
+        """
+        if self.node_id_set is None:
+            self.node_id_set = set(self.nodes["id"].tolist())
+            self.edge_key_set = set(self._get_edge_keys(self.edges).tolist())
+
+    @staticmethod
+    def _merge_sorted(frame, new_rows, column):
+        """
+        Insert new_rows into frame, which is sorted by column in descending order, keeping the
+        order. The existing rows are not sorted again.
+        """
+        if new_rows.shape[0] == 0:
+            return frame
+        new_rows = new_rows.sort_values(by=column, ascending=False, kind="stable")
+
+        num_rows = frame.shape[0]
+        num_new_rows = new_rows.shape[0]
+        # Position of each new row in the merged frame. Values are negated to sort ascending.
+        new_positions = np.searchsorted(
+            -frame[column].to_numpy(), -new_rows[column].to_numpy(), side="right"
+        ) + np.arange(num_new_rows)
+
+        is_new_row = np.zeros(num_rows + num_new_rows, dtype=bool)
+        is_new_row[new_positions] = True
+        rows = np.empty(num_rows + num_new_rows, dtype=np.int64)
+        rows[~is_new_row] = np.arange(num_rows)
+        rows[new_positions] = num_rows + np.arange(num_new_rows)
+
+        frame = pd.concat([frame, new_rows], ignore_index=True)
+        return frame.iloc[rows].reset_index(drop=True)
 
     def append_graph(self, input_graph):
         """
-        Docstring
+        Add the nodes and edges of input_graph that are not already in the graph.
+        Only the rows of input_graph are hashed, and they are merged into the existing sort order.
         """
-        nodes = pd.concat([self.nodes, input_graph.nodes])
-        edges = pd.concat([self.edges, input_graph.edges])
-        graph = DFGraph()
-        graph = DFGraph(nodes, edges)
-        self.update_graph(graph)
+        if self.nodes is None or self.edges is None:
+            self.update_graph(input_graph)
+            return
+
+        self._build_dedup_index()
+
+        is_new = [
+            node_id not in self.node_id_set
+            for node_id in input_graph.nodes["id"].tolist()
+        ]
+        new_nodes = input_graph.nodes[np.array(is_new, dtype=bool)]
+        self.node_id_set.update(new_nodes["id"].tolist())
+
+        edge_keys = self._get_edge_keys(input_graph.edges).tolist()
+        is_new = [edge_key not in self.edge_key_set for edge_key in edge_keys]
+        new_edges = input_graph.edges[np.array(is_new, dtype=bool)]
+        self.edge_key_set.update(self._get_edge_keys(new_edges).tolist())
+
+        self.nodes = self._merge_sorted(self.nodes, new_nodes, "screentime")
+        self.edges = self._merge_sorted(self.edges, new_edges, "weight")
+
+        # fmin/fmax ignore the NaN bounds of an empty graph
+        if new_nodes.shape[0] > 0:
+            self.screentime_min = np.fmin(
+                self.screentime_min, new_nodes["screentime"].min()
+            )
+            self.screentime_max = np.fmax(
+                self.screentime_max, new_nodes["screentime"].max()
+            )
+        if new_edges.shape[0] > 0:
+            self.edge_weight_min = np.fmin(
+                self.edge_weight_min, new_edges["weight"].min()
+            )
+            self.edge_weight_max = np.fmax(
+                self.edge_weight_max, new_edges["weight"].max()
+            )
+
+        if self.graph_summary is not None:
+            self.graph_summary.add_nodes(new_nodes)
+            self.graph_summary.add_edges(new_edges)
+        self._invalidate_adjacency_index()
+
+    def _invalidate_adjacency_index(self):
+        # Rebuilt by get_neighborhood_around_node when it is needed
+        self.node_positions = None
 
     def get_neighborhood_around_node(self, node_id, n_hops):
         """
-        Docstring...
-        """
-        # Initialise nodes
-        mask = self.nodes["id"] == node_id
-        nodes = self.nodes[mask]
-        # Initialize edges
-        edges = self.edges.drop(self.edges.index)
-        # Initialize node_ids
-        node_ids = set(nodes["id"])
-        # Expand neighborhood by iterating n_hops
-        for hop in range(n_hops):
-            # Update edges
-            mask = self.edges["from"].isin(node_ids) | self.edges["to"].isin(node_ids)
-            edges = self.edges[mask]
-            # Update node ids
-            node_ids.update(edges["from"])
-            node_ids.update(edges["to"])
-            # Update nodes
-            mask = self.nodes["id"].isin(node_ids)
-            nodes = self.nodes[mask]
-
-        return DFGraph(nodes, edges)
+        Breadth first search from node_id using the CSR adjacency index. Each hop only visits
+        the edges of the nodes reached in the previous hop. The result contains all nodes within
+        n_hops of node_id, and all edges incident to the nodes within n_hops - 1 of node_id.
+        """
+        return self.get_neighborhood_around_nodes([node_id], n_hops)
+
+    def get_neighborhood_around_nodes(self, node_ids, n_hops):
+        """
+        The neighborhood of get_neighborhood_around_node around several nodes at once
+        """
+        if self.node_positions is None:
+            self._build_adjacency_index()
+
+        visited = np.zeros(len(self.node_positions), dtype=bool)
+        edge_rows = [np.zeros(0, dtype=np.int64)]
+
+        starts = [self.node_positions.get(node_id) for node_id in node_ids]
+        starts = [
+            start
+            for start in starts
+            if start is not None and start < self.nodes.shape[0]
+        ]
+        if len(starts) > 0:
+            frontier = np.unique(starts)
+            visited[frontier] = True
+            # Expand neighborhood by iterating n_hops
+            for hop in range(n_hops):
+                if frontier.size == 0:
+                    break
+                slots = concatenate_ranges(
+                    self.adjacency_offsets[frontier],
+                    self.adjacency_offsets[frontier + 1],
+                )
+                edge_rows.append(self.adjacency_edges[slots])
+                neighbors = np.unique(self.adjacency_neighbors[slots])
+                frontier = neighbors[~visited[neighbors]]
+                visited[frontier] = True
+
+        # Positions below the number of nodes are row numbers in self.nodes
+        node_rows = np.flatnonzero(visited[: self.nodes.shape[0]])
+        edge_rows = np.unique(np.concatenate(edge_rows))
+
+        return DFGraph.from_sorted_frames(
+            self.nodes.iloc[node_rows], self.edges.iloc[edge_rows]
+        )
+
+    def get_shortest_path(self, source_id, target_id):
+        """
+        Node ids of a path between source_id and target_id with the smallest total distance,
+        where the distance of an edge is 1 / weight, so paths through strong relations are
+        preferred. Bidirectional Dijkstra over the CSR adjacency index: nodes are settled
+        alternately from both ends until the two searches meet, and the edges of a settled
+        node are relaxed at once with numpy. Returns an empty list if there is no path.
+        """
+        if self.node_positions is None:
+            self._build_adjacency_index()
+
+        num_nodes = self.nodes.shape[0]
+        source = self.node_positions.get(source_id, num_nodes)
+        target = self.node_positions.get(target_id, num_nodes)
+        if source >= num_nodes or target >= num_nodes:
+            return []
+
+        num_positions = len(self.node_positions)
+        # Index 0 searches from the source, index 1 from the target
+        distances = np.full((2, num_positions), np.inf)
+        previous = np.full((2, num_positions), -1, dtype=np.int64)
+        is_settled = np.zeros((2, num_positions), dtype=bool)
+        heaps = [[(0.0, source)], [(0.0, target)]]
+        distances[0, source] = 0.0
+        distances[1, target] = 0.0
+
+        best_distance = 0.0 if source == target else np.inf
+        meeting_position = source
+        while heaps[0] and heaps[1]:
+            # No path through unsettled nodes can be shorter than the best one found
+            if heaps[0][0][0] + heaps[1][0][0] >= best_distance:
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            distance, position = heapq.heappop(heaps[side])
+            if is_settled[side, position]:
+                continue
+            is_settled[side, position] = True
+
+            slots = slice(
+                self.adjacency_offsets[position], self.adjacency_offsets[position + 1]
+            )
+            neighbors = self.adjacency_neighbors[slots]
+            new_distances = distance + self.adjacency_distances[slots]
+            # Positions from num_nodes on are ids that are not nodes of the graph
+            is_shorter = (new_distances < distances[side, neighbors]) & (
+                neighbors < num_nodes
+            )
+            if is_shorter.any():
+                shorter_neighbors = neighbors[is_shorter]
+                shorter_distances = new_distances[is_shorter]
+                # A neighbor is listed twice if there are parallel edges, and the shorter
+                # distance is assigned last
+                order = np.argsort(-shorter_distances, kind="stable")
+                distances[side, shorter_neighbors[order]] = shorter_distances[order]
+                previous[side, shorter_neighbors] = position
+
+                # Hubs reach many nodes at once, which are heapified in one go rather than
+                # pushed one by one
+                entries = list(
+                    zip(shorter_distances.tolist(), shorter_neighbors.tolist())
+                )
+                heap = heaps[side]
+                if len(entries) > len(heap):
+                    heap.extend(entries)
+                    heapq.heapify(heap)
+                else:
+                    for entry in entries:
+                        heapq.heappush(heap, entry)
+
+            # Paths through an edge from this node to a node reached by the other search
+            path_distances = new_distances + distances[1 - side, neighbors]
+            if path_distances.size > 0:
+                i = np.argmin(path_distances)
+                if path_distances[i] < best_distance:
+                    best_distance = path_distances[i]
+                    meeting_position = neighbors[i]
+                    previous_on_side = position
+                    meeting_side = side
+
+        if best_distance == np.inf:
+            return []
+        if source == target:
+            return [source_id]
+
+        # Walk back from the meeting node to both ends
+        positions = [meeting_position]
+        position = previous_on_side
+        while position != -1:
+            positions.append(position)
+            position = previous[meeting_side, position]
+        positions.reverse()
+        position = previous[1 - meeting_side, meeting_position]
+        while position != -1:
+            positions.append(position)
+            position = previous[1 - meeting_side, position]
+        if meeting_side == 1:
+            positions.reverse()
+
+        # Positions below the number of nodes are row numbers in self.nodes
+        return self.nodes["id"].to_numpy()[positions].tolist()
 
     def _remove_edges_with_invalid_node_ids(self):
         # Filter edges to retain only those with valid 'from' and 'to' node IDs
@@ -128,10 +450,13 @@ class DFGraph:
         self.edges = self.edges[mask]
 
     def _filter_edges_using_weight(self, min_edge_weight):
+        # Compare in the precision of the column, see FilterIndex._screentime_rows
+        min_edge_weight = self.edges["weight"].dtype.type(min_edge_weight)
         mask = self.edges["weight"] >= min_edge_weight
         self.edges = self.edges[mask]
 
     def _filter_nodes_using_screentime(self, min_screentime):
+        min_screentime = self.nodes["screentime"].dtype.type(min_screentime)
         mask = self.nodes["screentime"] >= min_screentime
         self.nodes = self.nodes[mask]
         self._remove_edges_with_invalid_node_ids()
@@ -149,11 +474,48 @@ class DFGraph:
         self.update_graph(self)
 
     def delete_node_from_graph(self, node_id):
-        mask = ~(self.nodes["id"] == node_id)
-        self.nodes = self.nodes[mask]
+        self.delete_nodes_from_graph([node_id])
 
-        mask = ~((self.edges["from"] == node_id) | (self.edges["to"] == node_id))
-        self.edges = self.edges[mask]
+    def delete_nodes_from_graph(self, node_ids):
+        """
+        Delete the nodes with the ids node_ids and their edges, with one mask over the nodes
+        and one over the edges however many nodes are deleted
+        """
+        node_ids = list(node_ids)
+        is_deleted = self.nodes["id"].isin(node_ids).to_numpy()
+        if self.graph_summary is not None:
+            self.graph_summary.remove_nodes(self.nodes[is_deleted])
+        self.nodes = self.nodes[~is_deleted]
+
+        is_deleted = (
+            self.edges["from"].isin(node_ids) | self.edges["to"].isin(node_ids)
+        ).to_numpy()
+        if self.graph_summary is not None:
+            self.graph_summary.remove_edges(self.edges[is_deleted])
+        if self.edge_key_set is not None:
+            self.node_id_set.difference_update(node_ids)
+            self.edge_key_set.difference_update(
+                self._get_edge_keys(self.edges[is_deleted]).tolist()
+            )
+        self.edges = self.edges[~is_deleted]
+
+        self._update_bounds_from_sort_order()
+        self._invalidate_adjacency_index()
+
+    def _update_bounds_from_sort_order(self):
+        # The frames are sorted in descending order, so the bounds are their first and last
+        # rows. Bounds of an empty frame are NaN, as with min and max.
+        screentime = self.nodes["screentime"].to_numpy()
+        if len(screentime) > 0:
+            self.screentime_max, self.screentime_min = screentime[0], screentime[-1]
+        else:
+            self.screentime_max = self.screentime_min = screentime.dtype.type(np.nan)
+
+        weight = self.edges["weight"].to_numpy()
+        if len(weight) > 0:
+            self.edge_weight_max, self.edge_weight_min = weight[0], weight[-1]
+        else:
+            self.edge_weight_max = self.edge_weight_min = weight.dtype.type(np.nan)
 
     def __str__(self):
         display(self.nodes)
@@ -171,34 +533,20 @@ class DFGraph:
             num_edges = self.edges.shape[0]
         return f"Number of nodes: {num_nodes}, Number of edges: {num_edges}"
 
-    def create_graph_summary_table(self):
-        nodes = self.nodes
-        edges = self.edges
-
-        num_nodes = nodes.shape[0]
-        num_edges = edges.shape[0]
-
-        screentime_sum = nodes["screentime"].sum()
-        screentime_mean = nodes["screentime"].mean()
-        screentime_median = nodes["screentime"].median()
-
-        weight_sum = edges["weight"].sum()
-        weight_mean = edges["weight"].mean()
-        weight_median = edges["weight"].median()
-
-        self.graph_summary_table = pd.DataFrame(
-            columns=[
-                "Field Description",
-                "Value",
-            ],
-            data=[
-                ["Number of nodes", num_nodes],
-                ["Number of edges", num_edges],
-                ["screentime_sum", screentime_sum],
-                ["screentime_mean", screentime_mean],
-                ["screentime_median", screentime_median],
-                ["weight_sum", weight_sum],
-                ["weight_mean", weight_mean],
-                ["weight_median", weight_median],
-            ],
+    def memory_usage(self):
+        """
+        Approximate number of bytes used by the graph
+        """
+        if self.nodes is None or self.edges is None:
+            return 0
+        memory_usage = (
+            self.nodes.memory_usage().sum()
+            + self.edges.memory_usage().sum()
+            + self.adjacency_offsets.nbytes
+            + self.adjacency_neighbors.nbytes
+            + self.adjacency_edges.nbytes
+            + self.adjacency_distances.nbytes
         )
+        if self.graph_summary is not None:
+            memory_usage += self.graph_summary.memory_usage()
+        return memory_usage
@@ -0,0 +1,331 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from .dfgraph import DFGraph
+from .centrality import NodeCentrality
+from .utils import concatenate_ranges, GraphFilterParams
+
+
+@dataclass
+class FilterState:
+    """
+    The result of filtering a graph with a FilterIndex, kept so that the next filter can be
+    derived from it by only touching the rows whose status changes.
+    """
+
+    min_screentime: float
+    min_edge_weight: float
+    node_types_to_include: frozenset
+    centrality_metric: str
+    min_centrality_percentile: float
+
+    screentime_mask: np.ndarray
+    centrality_mask: np.ndarray
+    node_mask: np.ndarray
+    edge_endpoint_mask: np.ndarray
+    edge_weight_mask: np.ndarray
+
+    def memory_usage(self):
+        return (
+            self.screentime_mask.nbytes
+            + self.centrality_mask.nbytes
+            + self.node_mask.nbytes
+            + self.edge_endpoint_mask.nbytes
+            + self.edge_weight_mask.nbytes
+        )
+
+
+@dataclass
+class FilterIndex:
+    """
+    Threshold indexes over a graph: screentime, centrality percentiles and edge weights sorted
+    once, and the node rows of each gender. Filtering on a minimum screentime, percentile or
+    weight is then a searchsorted cut.
+    """
+
+    graph: DFGraph
+
+    screentime_sorted: np.ndarray
+    screentime_order: np.ndarray
+    # Sorted percentiles of the node rows and their order, per metric of the NodeCentrality
+    centrality_sorted: dict
+    centrality_order: dict
+    edge_weight_sorted: np.ndarray
+    edge_weight_order: np.ndarray
+    node_genders: np.ndarray
+    gender_partitions: dict
+
+    # Node row of the 'from' and 'to' node of each edge, -1 if the node is not in graph.nodes
+    edge_from_rows: np.ndarray
+    edge_to_rows: np.ndarray
+
+    def __init__(self, graph: DFGraph, centrality: NodeCentrality = None):
+        self.graph = graph
+        nodes = graph.nodes
+        edges = graph.edges
+
+        screentime = nodes["screentime"].to_numpy()
+        self.screentime_order = np.argsort(screentime, kind="stable")
+        self.screentime_sorted = screentime[self.screentime_order]
+
+        self.centrality_sorted = {}
+        self.centrality_order = {}
+        if centrality is not None:
+            for metric in centrality.percentiles:
+                percentiles = centrality.get_percentiles(metric, nodes["id"])
+                self.centrality_order[metric] = np.argsort(percentiles, kind="stable")
+                self.centrality_sorted[metric] = percentiles[
+                    self.centrality_order[metric]
+                ]
+
+        edge_weight = edges["weight"].to_numpy()
+        self.edge_weight_order = np.argsort(edge_weight, kind="stable")
+        self.edge_weight_sorted = edge_weight[self.edge_weight_order]
+
+        # Genders are categorical, and partitioned by their integer codes
+        self.node_genders = nodes["gender"].cat.codes.to_numpy()
+        self.gender_partitions = {
+            gender: np.flatnonzero(self.node_genders == code)
+            for code, gender in enumerate(nodes["gender"].cat.categories)
+        }
+
+        node_rows = pd.Index(nodes["id"])
+        self.edge_from_rows = node_rows.get_indexer(edges["from"])
+        self.edge_to_rows = node_rows.get_indexer(edges["to"])
+
+    def _screentime_rows(self, lower, upper):
+        """
+        Node rows with lower <= screentime < upper
+        """
+        # Thresholds are compared in the precision of the column, so that a threshold equal to
+        # a value as it is displayed includes it
+        bounds = np.array([lower, upper], dtype=self.screentime_sorted.dtype)
+        start, stop = np.searchsorted(self.screentime_sorted, bounds)
+        return self.screentime_order[start:stop]
+
+    def _centrality_rows(self, metric, lower, upper):
+        """
+        Node rows with lower <= percentile of the metric < upper
+        """
+        start, stop = np.searchsorted(self.centrality_sorted[metric], [lower, upper])
+        return self.centrality_order[metric][start:stop]
+
+    def _edge_weight_rows(self, lower, upper):
+        """
+        Edge rows with lower <= weight < upper
+        """
+        bounds = np.array([lower, upper], dtype=self.edge_weight_sorted.dtype)
+        start, stop = np.searchsorted(self.edge_weight_sorted, bounds)
+        return self.edge_weight_order[start:stop]
+
+    def get_filter_key(self, filter_params: GraphFilterParams):
+        """
+        Hashable form of filter_params that is equal for parameters giving the same filtered
+        graph: thresholds in the precision of their columns and raised to the smallest value
+        in the column, and the sorted genders that occur in the graph
+        """
+        min_screentime = self.screentime_sorted.dtype.type(filter_params.min_screentime)
+        if self.screentime_sorted.size > 0:
+            min_screentime = max(min_screentime, self.screentime_sorted[0])
+        min_edge_weight = self.edge_weight_sorted.dtype.type(
+            filter_params.min_edge_weight
+        )
+        if self.edge_weight_sorted.size > 0:
+            min_edge_weight = max(min_edge_weight, self.edge_weight_sorted[0])
+        node_types = set(filter_params.node_types_to_include)
+        return (
+            min_screentime,
+            min_edge_weight,
+            tuple(sorted(node_types & self.gender_partitions.keys())),
+            self._get_centrality_key(filter_params),
+        )
+
+    def _get_centrality_key(self, filter_params: GraphFilterParams):
+        """
+        The metric and the smallest percentile in the graph that is at least the minimum,
+        or None if no node is filtered out
+        """
+        metric = filter_params.centrality_metric
+        if metric not in self.centrality_sorted:
+            return None
+        percentiles = self.centrality_sorted[metric]
+        start = np.searchsorted(
+            percentiles, filter_params.min_centrality_percentile or 0
+        )
+        if start == 0:
+            return None
+        return (metric, percentiles[start] if start < len(percentiles) else np.inf)
+
+    def _gender_rows(self, node_types):
+        rows = [self.gender_partitions.get(gender, []) for gender in node_types]
+        return np.concatenate([np.zeros(0, dtype=np.int64)] + rows).astype(np.int64)
+
+    def _incident_edge_rows(self, node_rows):
+        # Node rows are also positions in the adjacency index of the graph
+        slots = concatenate_ranges(
+            self.graph.adjacency_offsets[node_rows],
+            self.graph.adjacency_offsets[node_rows + 1],
+        )
+        return self.graph.adjacency_edges[slots]
+
+    def _edges_with_valid_endpoints(self, node_mask, edge_rows=slice(None)):
+        node_mask = np.append(
+            node_mask, False
+        )  # Row -1 is a node that is not in the graph
+        return (
+            node_mask[self.edge_from_rows[edge_rows]]
+            & node_mask[self.edge_to_rows[edge_rows]]
+        )
+
+    def _create_centrality_mask(self, metric, min_percentile):
+        if metric not in self.centrality_sorted:
+            return np.ones(self.graph.nodes.shape[0], dtype=bool)
+        centrality_mask = np.zeros(self.graph.nodes.shape[0], dtype=bool)
+        centrality_mask[self._centrality_rows(metric, min_percentile, np.inf)] = True
+        return centrality_mask
+
+    def _exclude_node_rows(self, state: FilterState, mask, rows):
+        """
+        Clear the threshold mask of state at rows, and return the rows of the nodes this
+        removes from the filtered graph
+        """
+        mask[rows] = False
+        rows = rows[state.node_mask[rows]]
+        state.node_mask[rows] = False
+        return rows
+
+    def _include_node_rows(self, state: FilterState, mask, rows):
+        """
+        Set the threshold mask of state at rows, and return the rows of the nodes this adds to
+        the filtered graph, which are those that pass the other filters as well
+        """
+        mask[rows] = True
+        codes = [
+            code
+            for code, gender in enumerate(self.gender_partitions)
+            if gender in state.node_types_to_include
+        ]
+        rows = rows[
+            np.isin(self.node_genders[rows], codes)
+            & state.screentime_mask[rows]
+            & state.centrality_mask[rows]
+        ]
+        state.node_mask[rows] = True
+        return rows
+
+    def create_filter_state(self, filter_params: GraphFilterParams):
+        num_nodes = self.graph.nodes.shape[0]
+        num_edges = self.graph.edges.shape[0]
+
+        screentime_mask = np.zeros(num_nodes, dtype=bool)
+        screentime_mask[self._screentime_rows(filter_params.min_screentime, np.inf)] = (
+            True
+        )
+        centrality_mask = self._create_centrality_mask(
+            filter_params.centrality_metric,
+            filter_params.min_centrality_percentile or 0,
+        )
+
+        node_mask = np.zeros(num_nodes, dtype=bool)
+        node_mask[self._gender_rows(filter_params.node_types_to_include)] = True
+        node_mask &= screentime_mask & centrality_mask
+
+        edge_weight_mask = np.zeros(num_edges, dtype=bool)
+        edge_weight_mask[
+            self._edge_weight_rows(filter_params.min_edge_weight, np.inf)
+        ] = True
+
+        return FilterState(
+            min_screentime=filter_params.min_screentime,
+            min_edge_weight=filter_params.min_edge_weight,
+            node_types_to_include=frozenset(filter_params.node_types_to_include),
+            centrality_metric=filter_params.centrality_metric,
+            min_centrality_percentile=filter_params.min_centrality_percentile or 0,
+            screentime_mask=screentime_mask,
+            centrality_mask=centrality_mask,
+            node_mask=node_mask,
+            edge_endpoint_mask=self._edges_with_valid_endpoints(node_mask),
+            edge_weight_mask=edge_weight_mask,
+        )
+
+    def update_filter_state(self, state: FilterState, filter_params: GraphFilterParams):
+        """
+        Update state in place to filter_params. Only the nodes and edges whose thresholds lie
+        between the old and the new parameters are visited.
+        """
+        node_types = frozenset(filter_params.node_types_to_include)
+        removed_nodes = []
+        added_nodes = []
+
+        # Screentime
+        old, new = state.min_screentime, filter_params.min_screentime
+        rows = self._screentime_rows(min(old, new), max(old, new))
+        if new > old:
+            removed_nodes.append(
+                self._exclude_node_rows(state, state.screentime_mask, rows)
+            )
+        else:
+            added_nodes.append(
+                self._include_node_rows(state, state.screentime_mask, rows)
+            )
+
+        # Centrality
+        metric = filter_params.centrality_metric
+        old = state.min_centrality_percentile
+        new = filter_params.min_centrality_percentile or 0
+        if metric == state.centrality_metric and metric in self.centrality_sorted:
+            rows = self._centrality_rows(metric, min(old, new), max(old, new))
+            if new > old:
+                removed_nodes.append(
+                    self._exclude_node_rows(state, state.centrality_mask, rows)
+                )
+            else:
+                added_nodes.append(
+                    self._include_node_rows(state, state.centrality_mask, rows)
+                )
+        else:
+            # Another metric filters out other nodes, so its mask is compared in full
+            centrality_mask = self._create_centrality_mask(metric, new)
+            rows = np.flatnonzero(state.centrality_mask & ~centrality_mask)
+            removed_nodes.append(
+                self._exclude_node_rows(state, state.centrality_mask, rows)
+            )
+            rows = np.flatnonzero(~state.centrality_mask & centrality_mask)
+            added_nodes.append(
+                self._include_node_rows(state, state.centrality_mask, rows)
+            )
+
+        # Node types
+        rows = self._gender_rows(state.node_types_to_include - node_types)
+        rows = rows[state.node_mask[rows]]
+        state.node_mask[rows] = False
+        removed_nodes.append(rows)
+
+        rows = self._gender_rows(node_types - state.node_types_to_include)
+        rows = rows[state.screentime_mask[rows] & state.centrality_mask[rows]]
+        state.node_mask[rows] = True
+        added_nodes.append(rows)
+
+        # Edges of removed nodes lose an endpoint, edges of added nodes may have gained both
+        edge_rows = self._incident_edge_rows(np.concatenate(removed_nodes))
+        state.edge_endpoint_mask[edge_rows] = False
+        edge_rows = self._incident_edge_rows(np.concatenate(added_nodes))
+        state.edge_endpoint_mask[edge_rows] = self._edges_with_valid_endpoints(
+            state.node_mask, edge_rows
+        )
+
+        # Edge weight
+        old, new = state.min_edge_weight, filter_params.min_edge_weight
+        rows = self._edge_weight_rows(min(old, new), max(old, new))
+        state.edge_weight_mask[rows] = new <= old
+
+        state.min_screentime = filter_params.min_screentime
+        state.min_edge_weight = filter_params.min_edge_weight
+        state.node_types_to_include = node_types
+        state.centrality_metric = filter_params.centrality_metric
+        state.min_centrality_percentile = filter_params.min_centrality_percentile or 0
+
+    def create_filtered_graph(self, state: FilterState):
+        nodes = self.graph.nodes[state.node_mask]
+        edges = self.graph.edges[state.edge_endpoint_mask & state.edge_weight_mask]
+        return DFGraph.from_sorted_frames(nodes, edges)
@@ -0,0 +1,301 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from .dfgraph import DFGraph
+
+# Graphs up to this size get a spectral initial layout, larger ones a random one
+SPECTRAL_MAX_NODES = 1000
+# Repulsion is computed between all pairs of nodes up to this size, and against a random
+# sample of this many nodes for larger graphs
+REPULSION_SAMPLE_SIZE = 500
+# Rows of the pairwise repulsion computed at a time, to bound memory
+REPULSION_CHUNK_SIZE = 2000
+
+FULL_LAYOUT_ITERATIONS = 50
+INCREMENTAL_LAYOUT_ITERATIONS = 30
+
+
+def _repulsion(coordinates, rows, rng):
+    """
+    Fruchterman-Reingold repulsion k**2 / d on the nodes at rows, from all nodes, with k = 1
+    """
+    num_nodes = coordinates.shape[0]
+    others = coordinates
+    scale = 1.0
+    if num_nodes > REPULSION_SAMPLE_SIZE:
+        others = coordinates[
+            rng.choice(num_nodes, REPULSION_SAMPLE_SIZE, replace=False)
+        ]
+        scale = num_nodes / REPULSION_SAMPLE_SIZE
+
+    # With inverse[i, j] = 1 / d(i, j)**2, the sum over j of (x_i - x_j) * inverse[i, j] is
+    # x_i * sum_j inverse[i, j] - (inverse @ x)_i, so only n by m matrices are needed
+    others_squared_norms = (others**2).sum(axis=1)
+    displacement = np.empty((len(rows), 2))
+    for start in range(0, len(rows), REPULSION_CHUNK_SIZE):
+        chunk = coordinates[rows[start : start + REPULSION_CHUNK_SIZE]]
+        inverse = (chunk**2).sum(axis=1)[:, None] + others_squared_norms[None, :]
+        inverse -= 2 * chunk @ others.T
+        np.maximum(inverse, 1e-4, out=inverse)
+        np.reciprocal(inverse, out=inverse)
+        displacement[start : start + REPULSION_CHUNK_SIZE] = (
+            chunk * inverse.sum(axis=1)[:, None] - inverse @ others
+        )
+    return displacement * scale
+
+
+def force_directed_layout(
+    coordinates,
+    from_rows,
+    to_rows,
+    weights,
+    movable_rows,
+    iterations,
+    temperature,
+    seed=0,
+):
+    """
+    Fruchterman-Reingold layout, vectorized over nodes and edges, with an ideal edge length
+    of 1. Only the nodes at movable_rows are moved, the others are fixed.
+    Attraction along an edge is scaled by its weight relative to the mean weight.
+    """
+    rng = np.random.default_rng(seed)
+    coordinates = coordinates.copy()
+    is_movable = np.zeros(coordinates.shape[0], dtype=bool)
+    is_movable[movable_rows] = True
+    movable_edges = is_movable[from_rows] | is_movable[to_rows]
+    from_rows = from_rows[movable_edges]
+    to_rows = to_rows[movable_edges]
+    weights = weights[movable_edges]
+    if weights.size > 0:
+        weights = weights / weights.mean()
+
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        displacement = np.zeros_like(coordinates)
+        displacement[movable_rows] = _repulsion(coordinates, movable_rows, rng)
+
+        # Attraction d**2 / k along each edge
+        delta = coordinates[from_rows] - coordinates[to_rows]
+        distance = np.sqrt((delta**2).sum(axis=1))
+        attraction = delta * (distance * weights)[:, None]
+        np.add.at(displacement, from_rows, -attraction)
+        np.add.at(displacement, to_rows, attraction)
+
+        # Move each node at most temperature
+        length = np.maximum(np.sqrt((displacement**2).sum(axis=1)), 1e-9)
+        step = displacement * (np.minimum(length, temperature) / length)[:, None]
+        coordinates[movable_rows] += step[movable_rows]
+        temperature -= cooling
+    return coordinates
+
+
+def spectral_layout(from_rows, to_rows, weights, num_nodes):
+    """
+    Coordinates from the eigenvectors of the two smallest non-zero eigenvalues of the
+    normalized Laplacian, scaled to an area of about num_nodes. Uses a dense eigensolver, so
+    it is only meant for small graphs.
+    """
+    adjacency = np.zeros((num_nodes, num_nodes))
+    np.add.at(adjacency, (from_rows, to_rows), weights)
+    np.add.at(adjacency, (to_rows, from_rows), weights)
+    degrees = adjacency.sum(axis=1)
+    inverse_sqrt_degrees = np.where(
+        degrees > 0, 1 / np.sqrt(np.maximum(degrees, 1e-12)), 0
+    )
+    laplacian = np.eye(num_nodes) - (
+        inverse_sqrt_degrees[:, None] * adjacency * inverse_sqrt_degrees[None, :]
+    )
+    _, eigenvectors = np.linalg.eigh(laplacian)
+    coordinates = eigenvectors[:, 1:3]
+
+    coordinates = coordinates - coordinates.mean(axis=0)
+    spread = np.abs(coordinates).max()
+    if spread > 0:
+        coordinates = coordinates / spread * np.sqrt(num_nodes) / 2
+    return coordinates
+
+
+def _create_layout(from_rows, to_rows, weights, num_nodes, seed=0):
+    if num_nodes <= 2 or num_nodes > SPECTRAL_MAX_NODES:
+        rng = np.random.default_rng(seed)
+        coordinates = rng.uniform(0, np.sqrt(num_nodes), size=(num_nodes, 2))
+    else:
+        coordinates = spectral_layout(from_rows, to_rows, weights, num_nodes)
+        # Nodes of other components than the largest can share coordinates
+        rng = np.random.default_rng(seed)
+        coordinates += rng.uniform(-0.05, 0.05, size=coordinates.shape)
+
+    return force_directed_layout(
+        coordinates,
+        from_rows,
+        to_rows,
+        weights,
+        np.arange(num_nodes),
+        FULL_LAYOUT_ITERATIONS,
+        temperature=max(np.sqrt(num_nodes) / 10, 1.0),
+        seed=seed,
+    )
+
+
+def _spiral_offsets(rank, seed=0):
+    """
+    Offsets from the center of the points at the given ranks of a spiral starting one edge
+    length from its center
+    """
+    angles = rank * np.pi * (3 - np.sqrt(5)) + seed
+    radii = 1 + 0.5 * np.sqrt(rank)
+    return radii[:, None] * np.column_stack([np.cos(angles), np.sin(angles)])
+
+
+@dataclass
+class NodeLayout:
+    """
+    Coordinates of nodes by node id, computed server side so that the browser does not have to
+    run physics. Nodes keep their coordinates once placed, so when nodes are added to a graph,
+    only the new nodes are placed, around their neighbors that are already placed.
+    Coordinates are in units of the ideal edge length.
+    """
+
+    node_ids: np.ndarray
+    coordinates: np.ndarray
+
+    def __init__(self):
+        self.node_ids = np.zeros(0, dtype=np.int32)
+        self.coordinates = np.zeros((0, 2))
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def memory_usage(self):
+        return self.node_ids.nbytes + self.coordinates.nbytes
+
+    def _get_rows(self, node_ids):
+        """
+        Row of each node id in self.node_ids, -1 for nodes that are not placed
+        """
+        if len(self.node_ids) == 0:
+            return np.full(len(node_ids), -1)
+        rows = np.searchsorted(self.node_ids, node_ids)
+        rows = np.minimum(rows, len(self.node_ids) - 1)
+        return np.where(self.node_ids[rows] == node_ids, rows, -1)
+
+    def _add(self, node_ids, coordinates):
+        node_ids = np.concatenate([self.node_ids, node_ids])
+        coordinates = np.concatenate([self.coordinates, coordinates])
+        order = np.argsort(node_ids, kind="stable")
+        self.node_ids = node_ids[order]
+        self.coordinates = coordinates[order]
+
+    def get_coordinates(self, node_id):
+        """
+        Coordinates of the node, None if it is not placed
+        """
+        row = self._get_rows(np.array([node_id]))[0]
+        return None if row < 0 else self.coordinates[row]
+
+    def place_around(self, node_ids, center):
+        """
+        Place the nodes of node_ids that are not yet placed on a spiral around center
+        """
+        node_ids = np.asarray(node_ids)
+        node_ids = np.unique(node_ids[self._get_rows(node_ids) < 0])
+        self._add(node_ids, center + _spiral_offsets(np.arange(len(node_ids))))
+
+    def place_graph(self, graph: DFGraph, seed=0):
+        """
+        Coordinates of the nodes of graph, in the order of graph.nodes. Nodes that are not yet
+        placed are placed first: next to their placed neighbors if they have any, otherwise by
+        laying out the rest of the graph next to the placed nodes.
+        """
+        node_ids = graph.nodes["id"].to_numpy()
+        num_nodes = len(node_ids)
+        rows = self._get_rows(node_ids)
+        is_placed = rows >= 0
+        if is_placed.all():
+            return self.coordinates[rows]
+
+        node_rows = pd.Index(node_ids)
+        from_rows = node_rows.get_indexer(graph.edges["from"])
+        to_rows = node_rows.get_indexer(graph.edges["to"])
+        valid = (from_rows >= 0) & (to_rows >= 0)
+        from_rows = from_rows[valid]
+        to_rows = to_rows[valid]
+        weights = graph.edges["weight"].to_numpy(dtype=np.float64)[valid]
+
+        coordinates = np.zeros((num_nodes, 2))
+        coordinates[is_placed] = self.coordinates[rows[is_placed]]
+        new_rows = np.flatnonzero(~is_placed)
+
+        if not is_placed.any():
+            coordinates = _create_layout(from_rows, to_rows, weights, num_nodes, seed)
+        else:
+            self._place_around_neighbors(
+                coordinates, is_placed, from_rows, to_rows, weights, seed
+            )
+            coordinates = force_directed_layout(
+                coordinates,
+                from_rows,
+                to_rows,
+                weights,
+                new_rows,
+                INCREMENTAL_LAYOUT_ITERATIONS,
+                temperature=0.5,
+                seed=seed,
+            )
+
+        self._add(node_ids[new_rows], coordinates[new_rows])
+        return coordinates
+
+    def _place_around_neighbors(
+        self, coordinates, is_placed, from_rows, to_rows, weights, seed
+    ):
+        """
+        Place unplaced nodes in a ring around the mean of their placed neighbors, one hop at a
+        time. Components without placed nodes are laid out on their own, right of the others.
+        """
+        is_placed = is_placed.copy()
+        while not is_placed.all():
+            # Edges from a placed node to an unplaced one, in both directions
+            anchors = np.concatenate([from_rows, to_rows])
+            targets = np.concatenate([to_rows, from_rows])
+            crossing = is_placed[anchors] & ~is_placed[targets]
+            if not crossing.any():
+                break
+            anchors = anchors[crossing]
+            targets = targets[crossing]
+
+            counts = np.bincount(targets, minlength=len(is_placed))
+            sums = np.zeros_like(coordinates)
+            np.add.at(sums, targets, coordinates[anchors])
+            new_rows = np.flatnonzero(counts > 0)
+            centers = sums[new_rows] / counts[new_rows, None]
+
+            # Spread the nodes sharing an anchor point on a spiral around it, starting one edge
+            # length away
+            _, inverse = np.unique(centers, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            order = np.argsort(inverse, kind="stable")
+            group_starts = np.searchsorted(inverse[order], inverse[order])
+            rank = np.empty(len(new_rows), dtype=np.int64)
+            rank[order] = np.arange(len(new_rows)) - group_starts
+            coordinates[new_rows] = centers + _spiral_offsets(rank, seed)
+            is_placed[new_rows] = True
+
+        if not is_placed.all():
+            rows = np.flatnonzero(~is_placed)
+            component_rows = pd.Index(rows)
+            is_inside = ~is_placed[from_rows] & ~is_placed[to_rows]
+            component = _create_layout(
+                component_rows.get_indexer(from_rows[is_inside]),
+                component_rows.get_indexer(to_rows[is_inside]),
+                weights[is_inside],
+                len(rows),
+                seed,
+            )
+            placed = coordinates[is_placed]
+            offset = [
+                placed[:, 0].max() + 2 - component[:, 0].min(),
+                placed[:, 1].min() - component[:, 1].min(),
+            ]
+            coordinates[rows] = component + offset
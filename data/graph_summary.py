@@ -0,0 +1,128 @@
+from copy import copy
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass
+class RunningStatistics:
+    """
+    Count, sum and exact median of a collection of values that changes by adding and removing
+    values. The values are kept in a sorted array, and each batch of added or removed values
+    is merged into it with searchsorted.
+    """
+
+    sorted_values: np.ndarray
+    sum: float
+
+    def __init__(self, values_sorted_descending):
+        self.sorted_values = np.array(
+            np.asarray(values_sorted_descending, dtype=np.float64)[::-1]
+        )
+        self.sum = float(np.sum(self.sorted_values))
+
+    @property
+    def count(self):
+        return len(self.sorted_values)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count > 0 else np.nan
+
+    @property
+    def median(self):
+        count = self.count
+        if count == 0:
+            return np.nan
+        middle = count // 2
+        if count % 2 == 1:
+            return float(self.sorted_values[middle])
+        return float(self.sorted_values[middle - 1] + self.sorted_values[middle]) / 2
+
+    def memory_usage(self):
+        return self.sorted_values.nbytes
+
+    def copy(self):
+        statistics = copy(self)
+        statistics.sorted_values = self.sorted_values.copy()
+        return statistics
+
+    def add(self, values):
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        positions = np.searchsorted(self.sorted_values, values)
+        self.sorted_values = np.insert(self.sorted_values, positions, values)
+        self.sum += float(values.sum())
+
+    def remove(self, values):
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        if len(values) == 0:
+            return
+        # Equal values are removed from consecutive positions, so the nth of them in values
+        # is found n positions after the first
+        is_first = np.ones(len(values), dtype=bool)
+        is_first[1:] = values[1:] != values[:-1]
+        indices = np.arange(len(values))
+        rank = indices - np.maximum.accumulate(np.where(is_first, indices, 0))
+        positions = np.searchsorted(self.sorted_values, values) + rank
+        self.sorted_values = np.delete(self.sorted_values, positions)
+        self.sum -= float(values.sum())
+        if len(self.sorted_values) == 0:
+            self.sum = 0.0
+
+
+@dataclass
+class GraphSummary:
+    """
+    Summary statistics of a DFGraph, updated as nodes and edges are added and removed instead of
+    being recomputed. Expects the nodes sorted by screentime and the edges sorted by weight, both
+    in descending order, as they are in a DFGraph.
+    """
+
+    screentime: RunningStatistics
+    weight: RunningStatistics
+
+    def __init__(self, nodes, edges):
+        self.screentime = RunningStatistics(nodes["screentime"].to_numpy())
+        self.weight = RunningStatistics(edges["weight"].to_numpy())
+
+    def memory_usage(self):
+        return self.screentime.memory_usage() + self.weight.memory_usage()
+
+    def copy(self):
+        summary = copy(self)
+        summary.screentime = self.screentime.copy()
+        summary.weight = self.weight.copy()
+        return summary
+
+    def add_nodes(self, nodes):
+        self.screentime.add(nodes["screentime"].to_numpy())
+
+    def remove_nodes(self, nodes):
+        self.screentime.remove(nodes["screentime"].to_numpy())
+
+    def add_edges(self, edges):
+        self.weight.add(edges["weight"].to_numpy())
+
+    def remove_edges(self, edges):
+        self.weight.remove(edges["weight"].to_numpy())
+
+    def get_fields(self):
+        return {
+            "Number of nodes": self.screentime.count,
+            "Number of edges": self.weight.count,
+            "screentime_sum": self.screentime.sum,
+            "screentime_mean": self.screentime.mean,
+            "screentime_median": self.screentime.median,
+            "weight_sum": self.weight.sum,
+            "weight_mean": self.weight.mean,
+            "weight_median": self.weight.median,
+        }
+
+    def to_records(self, fields_to_display):
+        """
+        The given fields as rows of a dash DataTable
+        """
+        fields = self.get_fields()
+        return [
+            {"Field Description": field, "Value": fields[field]}
+            for field in fields_to_display
+        ]
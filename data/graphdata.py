@@ -1,19 +1,69 @@
-import os
 from copy import copy
 from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 from .utils import GraphFilterParams
 from .dfgraph import DFGraph
-from .load_data import load_got
-from config import FILE_PATH_FOR_IMAGES
+from .filter_index import FilterIndex, FilterState
+from .load_data import load_got, load_cached_arrays, create_compact_frames
+from .string_table import StringTable
+from .graph_layout import NodeLayout
+from .communities import (
+    CommunityHierarchy,
+    compute_community_labels,
+    aggregate_graph,
+    COMMUNITY_LABELS_VERSION,
+)
+from .centrality import (
+    NodeCentrality,
+    compute_centrality,
+    CENTRALITY_METRICS,
+    CENTRALITY_VERSION,
+    DEFAULT_CENTRALITY_METRIC,
+)
+from .node_search import NodeSearchIndex, normalize_name
+from .portraits import PortraitManifest
+from .result_cache import ResultCache
+from config import (
+    FILE_PATH_FOR_IMAGES,
+    PORTRAIT_THUMBNAIL_DIRECTORY,
+    PORTRAIT_FALLBACK_PATH,
+    COMMUNITY_AGGREGATION_MIN_NODES,
+    FILTER_CACHE_MAX_ENTRIES,
+    FILTER_CACHE_MAX_BYTES,
+    NEIGHBORHOOD_CACHE_MAX_ENTRIES,
+    NEIGHBORHOOD_CACHE_MAX_BYTES,
+    NODE_SEARCH_RANKING,
+    NODE_SEARCH_MAX_RESULTS,
+    NODE_SEARCH_MIN_SIMILARITY,
+)
 
+# Scanned once at startup, see app.py for how it is kept up to date
+portrait_manifest = PortraitManifest(
+    FILE_PATH_FOR_IMAGES, PORTRAIT_THUMBNAIL_DIRECTORY, PORTRAIT_FALLBACK_PATH
+)
 
-def create_portrait_image_path(node):
-    image_path = os.path.join(FILE_PATH_FOR_IMAGES, f"{node['id']}.png")
+# Pixels per unit of NodeLayout coordinates, which is the ideal edge length
+LAYOUT_SCALE = 200
 
-    if os.path.exists(image_path):
-        return image_path
-    else:
-        return "https://e7.pngegg.com/pngimages/549/612/png-clipart-three-headed-dragon-illustration-daenerys-targaryen-tyrion-lannister-sansa-stark-house-targaryen-house-stark-throne-miscellaneous-dragon-thumbnail.png"
+# vis.js options for the nodes created by GraphData, see layout.network_component. The styling
+# shared by all nodes is set once here, and each node only refers to the group of its gender,
+# or to COMMUNITY_GROUP for collapsed communities.
+COMMUNITY_GROUP = "community"
+VISDCC_NODE_OPTIONS = {
+    "nodes": {
+        "shape": "circularImage",
+        "imagePadding": {"left": 200, "top": 100, "right": 80, "bottom": 20},
+        "borderWidth": 10,
+        "font": {"size": "20", "face": "'Trajan Pro'", "color": "white"},
+    },
+    "groups": {
+        "male": {"color": "#FCFEF0"},
+        "female": {"color": "#B9540C"},
+        COMMUNITY_GROUP: {"shape": "dot", "color": "#6B4A2F"},
+    },
+}
 
 
 @dataclass
@@ -21,16 +71,146 @@ class GraphData:
     graph_whole: DFGraph
     graph_filtered: DFGraph
     graph_display: DFGraph
+    node_names: StringTable
     filter_params: GraphFilterParams
+    centrality: NodeCentrality
+    filter_index: FilterIndex
+    node_search_index: NodeSearchIndex
+    filter_state: FilterState
+    filter_key: tuple
+    filtered_graph_cache: ResultCache
+    neighborhood_cache: ResultCache
+    community_hierarchy: CommunityHierarchy
+    collapsed_communities: set
+    rendered_node_ids: set
+    rendered_edge_ids: set
+    needs_full_render: bool
+    node_layout: NodeLayout
+    node_size_metric: str
 
-    def __init__(self):
-        nodes, edges = load_got()
+    def __init__(self, nodes=None, edges=None):
+        """
+        Loads the data with load_got, unless nodes and edges are given in the schema of the CSV files
+        """
+        is_loaded = nodes is None or edges is None
+        if is_loaded:
+            nodes, edges, node_names = load_got()
+        else:
+            nodes, edges, node_names = create_compact_frames(nodes, edges)
+        self.node_names = node_names
         self.graph_whole = DFGraph(nodes, edges)
-        self.graph_filtered = DFGraph(nodes, edges)
+        # Filtered graphs are never modified, so they are shared between sessions. The cache
+        # is created with the data, so reloading the data starts with an empty cache.
+        self.filtered_graph_cache = ResultCache(
+            FILTER_CACHE_MAX_ENTRIES, FILTER_CACHE_MAX_BYTES, DFGraph.memory_usage
+        )
+        # Neighborhoods in filtered graphs, see get_neighborhood_around_node
+        self.neighborhood_cache = ResultCache(
+            NEIGHBORHOOD_CACHE_MAX_ENTRIES,
+            NEIGHBORHOOD_CACHE_MAX_BYTES,
+            DFGraph.memory_usage,
+        )
+
+        def create_community_labels():
+            levels = compute_community_labels(self.graph_whole, len(self.node_names))
+            return {f"level_{level}": labels for level, labels in enumerate(levels, 1)}
+
+        def create_centrality():
+            return compute_centrality(self.graph_whole, len(self.node_names))
+
+        if is_loaded:
+            community_labels = load_cached_arrays(
+                "community_labels", COMMUNITY_LABELS_VERSION, create_community_labels
+            )
+            centrality = load_cached_arrays(
+                "centrality", CENTRALITY_VERSION, create_centrality
+            )
+        else:
+            community_labels = create_community_labels()
+            centrality = create_centrality()
+        self.community_hierarchy = CommunityHierarchy(
+            [
+                community_labels[f"level_{level}"]
+                for level in range(1, len(community_labels) + 1)
+            ],
+            len(self.node_names),
+        )
+        self.centrality = NodeCentrality(centrality)
+        self.filter_index = FilterIndex(self.graph_whole, self.centrality)
+
+        node_ids = self.graph_whole.nodes["id"].to_numpy()
+        if NODE_SEARCH_RANKING in CENTRALITY_METRICS:
+            search_scores = self.centrality.values[NODE_SEARCH_RANKING][node_ids]
+        else:
+            search_scores = self.graph_whole.nodes["screentime"].to_numpy()
+        self.node_search_index = NodeSearchIndex(
+            self.node_names.decode(node_ids), search_scores
+        )
+        self.reset_state()
+
+    def reset_state(self):
+        """
+        Reset everything that changes as a user interacts with the dashboard.
+        graph_whole, filter_index, node_search_index, the caches, community_hierarchy and
+        centrality are shared between sessions.
+        """
+        self.graph_filtered = self.graph_whole
         self.graph_display = DFGraph()
+        self.filter_state = None
+        # FilterIndex.get_filter_key of graph_filtered, None while it is graph_whole
+        self.filter_key = None
+
+        # Node ids of the communities of community_hierarchy that graph_display is shown with,
+        # see collapse_large_display_graph
+        self.collapsed_communities = set()
+
+        # What the client has been sent, see create_visdcc_network_update
+        self.rendered_node_ids = set()
+        self.rendered_edge_ids = set()
+        self.needs_full_render = True
+
+        # Coordinates of the nodes of graph_filtered, see update_filter
+        self.node_layout = NodeLayout()
 
-        node_types_to_include = nodes["gender"].drop_duplicates().to_list()
-        self.filter_params = GraphFilterParams(0, 0, node_types_to_include)
+        # "screentime" or a metric of centrality, see set_node_size_metric
+        self.node_size_metric = "screentime"
+
+        node_types_to_include = (
+            self.graph_whole.nodes["gender"].drop_duplicates().to_list()
+        )
+        self.filter_params = GraphFilterParams(
+            0, 0, node_types_to_include, DEFAULT_CENTRALITY_METRIC, 0
+        )
+
+    def new_session(self):
+        """
+        Create a GraphData for a new user session, sharing graph_whole, filter_index, the
+        caches, community_hierarchy and centrality with self
+        """
+        session = copy(self)
+        session.reset_state()
+        return session
+
+    def memory_usage(self):
+        """
+        Approximate number of bytes used by the state of this session, excluding graph_whole
+        and graph_filtered, which are shared with other sessions
+        """
+        memory_usage = (
+            self.graph_display.memory_usage() + self.node_layout.memory_usage()
+        )
+        if self.filter_state is not None:
+            memory_usage += self.filter_state.memory_usage()
+        return memory_usage
+
+    def set_node_size_metric(self, node_size_metric):
+        """
+        Size the nodes by screentime, or by a metric of CENTRALITY_METRICS. All nodes are
+        resized by rendering the network in full.
+        """
+        if node_size_metric is not None and node_size_metric != self.node_size_metric:
+            self.node_size_metric = node_size_metric
+            self.needs_full_render = True
 
     def __str__(self):
         s = (
@@ -60,68 +240,429 @@ class GraphData:
                     self.graph_whole.nodes["gender"].drop_duplicates().to_list()
                 )
 
-        self.graph_filtered = copy(self.graph_whole)
-        self.graph_filtered.filter_graph(self.filter_params)
+        if new_params.centrality_metric is not None:
+            self.filter_params.centrality_metric = new_params.centrality_metric
+
+        if new_params.min_centrality_percentile is not None:
+            self.filter_params.min_centrality_percentile = (
+                new_params.min_centrality_percentile
+            )
+
+        filter_key = self.filter_index.get_filter_key(self.filter_params)
+        self.graph_filtered = self.filtered_graph_cache.get(
+            filter_key, self._create_filtered_graph
+        )
+
+        # Node coordinates are kept as long as the filtered graph is the same
+        if filter_key != self.filter_key:
+            self.node_layout = NodeLayout()
+        self.filter_key = filter_key
+
+    def _create_filtered_graph(self):
+        # Derive the new filter from the previous one, so only rows between the old and new
+        # thresholds are visited. filter_state is only updated when the filtered graph is not
+        # cached, which is fine since it is updated from its own parameters.
+        if self.filter_state is None:
+            self.filter_state = self.filter_index.create_filter_state(
+                self.filter_params
+            )
+        else:
+            self.filter_index.update_filter_state(self.filter_state, self.filter_params)
+
+        return self.filter_index.create_filtered_graph(self.filter_state)
 
     def add_subgraph_to_displaygraph(self, input_graph: DFGraph):
-        input_graph.filter_graph(self.filter_params)
+        """
+        input_graph is expected to be a subgraph of graph_filtered, so it is already filtered
+        """
         self.graph_display.append_graph(input_graph)
 
-    def get_options_for_dropdown(self):
-        return [{"label": i, "value": i} for i in self.graph_whole.nodes["id"]]
+    def set_display_graph(self, graph: DFGraph):
+        """
+        Display a copy of graph, which may be shared, e.g. from get_neighborhood_around_node.
+        Large graphs are shown as communities.
+        """
+        self.graph_display = graph.copy()
+        self.graph_display.get_graph_summary()
+        self.collapse_large_display_graph()
 
-    def create_visddc_network(self):
+    def get_neighborhood_around_node(self, node_id, n_hops):
         """
-        Dockstring
+        The neighborhood in graph_filtered of the node with the name node_id.
+        Neighborhoods are cached by node, number of hops and filter, and shared between
+        sessions, so the returned graph must not be modified, see set_display_graph.
         """
-        if self.graph_display.nodes is None or self.graph_display.edges is None:
-            graph_data = {"nodes": {}, "edges": {}}
-            return graph_data
+        node_id = self.node_names.encode_one(node_id)
+        graph_filtered = self.graph_filtered
+        return self.neighborhood_cache.get(
+            (node_id, n_hops, self.filter_key),
+            lambda: graph_filtered.get_neighborhood_around_node(node_id, n_hops),
+        )
 
-        dict_nodes = self.graph_display.nodes.to_dict("records")
-        dict_edges = self.graph_display.edges.to_dict("records")
+    def get_shortest_path_neighborhood(self, source_id, target_id):
+        """
+        The shortest path in graph_filtered between the nodes with the names source_id and
+        target_id, see DFGraph.get_shortest_path, with the neighbors of the nodes on the path.
+        Only the two nodes are returned if there is no path. Cached like
+        get_neighborhood_around_node.
+        """
+        source_id = self.node_names.encode_one(source_id)
+        target_id = self.node_names.encode_one(target_id)
+        graph_filtered = self.graph_filtered
 
-        node_coloring = {"male": "#FCFEF0", "female": "#B9540C"}
+        def create_path_neighborhood():
+            path = graph_filtered.get_shortest_path(source_id, target_id)
+            if len(path) == 0:
+                return graph_filtered.get_neighborhood_around_nodes(
+                    [source_id, target_id], 0
+                )
+            return graph_filtered.get_neighborhood_around_nodes(path, 1)
 
-        nodes = [
+        # A path is the same in both directions
+        return self.neighborhood_cache.get(
+            (
+                "path",
+                min(source_id, target_id),
+                max(source_id, target_id),
+                self.filter_key,
+            ),
+            create_path_neighborhood,
+        )
+
+    def warm_up_neighborhood_cache(self, num_nodes, ranking="degree", n_hops=(1, 2)):
+        """
+        Compute the neighborhoods of the num_nodes nodes with the highest degree, screentime
+        or metric of CENTRALITY_METRICS in the graph filtered with the default filter, so the
+        most common queries are cached from the start
+        """
+        session = self.new_session()
+        session.update_filter(GraphFilterParams(None, None, None))
+        nodes = session.graph_filtered.nodes
+        if ranking == "degree":
+            edges = session.graph_filtered.edges
+            degrees = pd.concat([edges["from"], edges["to"]]).value_counts()
+            node_ids = degrees.index[degrees.index.isin(nodes["id"])][:num_nodes]
+        elif ranking in CENTRALITY_METRICS:
+            node_ids = self.centrality.get_top_node_ids(ranking, num_nodes)
+        else:
+            # Nodes are sorted by screentime
+            node_ids = nodes["id"][:num_nodes]
+
+        for node_name in self.node_names.decode(node_ids):
+            for hops in n_hops:
+                session.get_neighborhood_around_node(node_name, hops)
+
+    def delete_node_from_display_graph(self, node_id):
+        community_node_id = self.community_hierarchy.get_community_node_id(node_id)
+        if community_node_id in self.collapsed_communities:
+            # Deleting a community deletes all its members
+            self.graph_display.delete_nodes_from_graph(
+                self._get_community_members(community_node_id).tolist()
+            )
+            self.collapsed_communities.discard(community_node_id)
+            self.needs_full_render = True
+            return
+
+        node_id = self.node_names.encode_one(node_id)
+        self.graph_display.delete_node_from_graph(node_id)
+
+    def collapse_large_display_graph(self):
+        """
+        Show graph_display as communities if it has more than COMMUNITY_AGGREGATION_MIN_NODES
+        nodes, at the most detailed level of community_hierarchy with at most that many
+        communities in graph_display, or else at the least detailed level
+        """
+        self.collapsed_communities = set()
+        self.needs_full_render = True
+        if self.graph_display.nodes is None:
+            return
+
+        node_ids = self.graph_display.nodes["id"].to_numpy()
+        if len(node_ids) <= COMMUNITY_AGGREGATION_MIN_NODES:
+            return
+        for level in range(1, self.community_hierarchy.num_levels + 1):
+            community_node_ids = np.unique(
+                self.community_hierarchy.get_community_node_ids(level, node_ids)
+            )
+            if len(community_node_ids) <= COMMUNITY_AGGREGATION_MIN_NODES:
+                break
+        else:
+            if self.community_hierarchy.num_levels == 0:
+                return
+        self.collapsed_communities = set(community_node_ids.tolist())
+
+    def _get_community_members(self, community_node_id):
+        """
+        Node ids of the nodes of graph_display in the community
+        """
+        level, _ = self.community_hierarchy.parse_community_node_id(community_node_id)
+        node_ids = self.graph_display.nodes["id"].to_numpy()
+        community_node_ids = self.community_hierarchy.get_community_node_ids(
+            level, node_ids
+        )
+        return node_ids[community_node_ids == community_node_id]
+
+    def expand_community(self, community_name):
+        """
+        Show the members of a collapsed community: its communities at the level below, or its
+        nodes at the lowest level. They are placed around the community.
+        """
+        community_node_id = self.community_hierarchy.get_community_node_id(
+            community_name
+        )
+        if community_node_id not in self.collapsed_communities:
+            return
+
+        level, _ = self.community_hierarchy.parse_community_node_id(community_node_id)
+        member_ids = self._get_community_members(community_node_id)
+        if level > 1:
+            member_ids = np.unique(
+                self.community_hierarchy.get_community_node_ids(level - 1, member_ids)
+            )
+            self.collapsed_communities.update(member_ids.tolist())
+        self.collapsed_communities.discard(community_node_id)
+        self.needs_full_render = True
+
+        center = self.node_layout.get_coordinates(community_node_id)
+        if center is not None:
+            self.node_layout.place_around(member_ids, center)
+
+    def _get_visible_display_graph(self):
+        """
+        graph_display with the nodes of collapsed communities replaced by their community
+        """
+        if not self.collapsed_communities:
+            return self.graph_display
+        representatives = self.community_hierarchy.get_node_representatives(
+            self.graph_display.nodes["id"].to_numpy(), self.collapsed_communities
+        )
+        return aggregate_graph(self.graph_display, representatives)
+
+    def _decode_node_ids(self, node_ids):
+        """
+        Names of node ids, including the negative node ids of communities
+        """
+        node_ids = np.asarray(node_ids)
+        names = np.empty(len(node_ids), dtype=object)
+        is_community = node_ids < 0
+        names[~is_community] = self.node_names.decode(node_ids[~is_community])
+        names[is_community] = self.community_hierarchy.get_community_names(
+            node_ids[is_community]
+        )
+        return names
+
+    def get_options_for_dropdown(self, search_value=None, value=None):
+        """
+        Options of the node dropdowns: the best NODE_SEARCH_MAX_RESULTS matches of
+        search_value in node_search_index. The selected value is kept as an option, since the
+        dropdown does not show a value that is not one.
+        """
+        node_names = self.node_search_index.search(
+            search_value, NODE_SEARCH_MAX_RESULTS, NODE_SEARCH_MIN_SIMILARITY
+        )
+        if value is not None and value not in node_names:
+            node_names.insert(0, value)
+
+        # The dropdown filters the options again in the browser, by the prefixes of the words
+        # of their search text. The words of search_value are added to it, so that matches
+        # found here, e.g. misspelled ones, are not hidden.
+        search_words = normalize_name(search_value or "")
+        return [
             {
-                "id": node["id"],
-                "label": None,
-                "image": create_portrait_image_path(node),
-                "shape": "circularImage",
-                "imagePadding": {"left": 200, "top": 100, "right": 80, "bottom": 20},
-                "borderWidth": 10,
-                "size": self.graph_whole.get_node_size(node["screentime"]),
-                "color": node_coloring[node["gender"]],
-                "font": {
-                    "size": "20",
-                    "face": "'Trajan Pro'",
-                    "color": "white",
-                },
-                "title": f"""Name: {node["id"].replace("-", " ")} <br> Gender: {node['gender']} <br> Screentine: {node['screentime']}""",
+                "label": i,
+                "value": i,
+                "search": f"{normalize_name(i)} {search_words}".rstrip(),
             }
-            for node in dict_nodes
+            for i in node_names
         ]
 
-        edges = [
+    def _create_visdcc_nodes(self, nodes, coordinates):
+        """
+        All attributes are computed column-wise, and only the final dicts are built per node.
+        Node ids are converted back to names here. coordinates are the NodeLayout coordinates
+        of the nodes. Styling is taken from VISDCC_NODE_OPTIONS, by the group of each node.
+        """
+        ids = pd.Series(self.node_names.decode(nodes["id"]), dtype=object)
+        genders = nodes["gender"].astype(str).reset_index(drop=True)
+        screentime = nodes["screentime"].reset_index(drop=True)
+
+        if self.node_size_metric in self.centrality.percentiles:
+            sizes = self.centrality.get_node_size(self.node_size_metric, nodes["id"])
+        else:
+            sizes = self.graph_whole.get_node_size(screentime)
+        images = portrait_manifest.get_image_paths(ids, sizes)
+        sizes = np.round(sizes, 1)
+        titles = (
+            "Name: "
+            + ids.str.replace("-", " ")
+            + " <br> Gender: "
+            + genders
+            + " <br> Screentine: "
+            + screentime.astype(str)
+        )
+
+        xs = np.round(coordinates[:, 0] * LAYOUT_SCALE, 1)
+        ys = np.round(coordinates[:, 1] * LAYOUT_SCALE, 1)
+
+        return [
+            {
+                "id": id,
+                "group": group,
+                "size": size,
+                "image": image,
+                "title": title,
+                "x": x,
+                "y": y,
+            }
+            for id, group, size, image, title, x, y in zip(
+                ids.tolist(),
+                genders.tolist(),
+                sizes.tolist(),
+                images.tolist(),
+                titles.tolist(),
+                xs.tolist(),
+                ys.tolist(),
+            )
+        ]
+
+    def _create_visdcc_community_nodes(self, nodes, coordinates):
+        """
+        Nodes of collapsed communities, sized by their number of members
+        """
+        ids = self._decode_node_ids(nodes["id"].to_numpy())
+        members = nodes["members"].to_numpy()
+        screentime = nodes["screentime"].to_numpy()
+        sizes = np.round(np.minimum(20 + 10 * np.log2(members), 100), 1)
+        xs = np.round(coordinates[:, 0] * LAYOUT_SCALE, 1)
+        ys = np.round(coordinates[:, 1] * LAYOUT_SCALE, 1)
+
+        return [
             {
-                "id": edge["from"] + "__" + edge["to"],
-                "from": edge["from"],
-                "to": edge["to"],
-                "width": self.graph_whole.get_edge_width(edge["weight"]),
+                "id": id,
+                "group": COMMUNITY_GROUP,
+                "label": f"Community ({member_count})",
+                "size": size,
+                "title": f"Characters: {member_count} <br> Screentime: {screentime_sum:.2f}",
+                "x": x,
+                "y": y,
             }
-            for edge in dict_edges
+            for id, member_count, screentime_sum, size, x, y in zip(
+                ids.tolist(),
+                members.tolist(),
+                screentime.tolist(),
+                sizes.tolist(),
+                xs.tolist(),
+                ys.tolist(),
+            )
+        ]
+
+    def _create_visdcc_edges(self, edges):
+        """
+        Edges have no id, since vis.js generates one, and are identified by their from and to
+        nodes in create_visdcc_network_update
+        """
+        from_ids = self._decode_node_ids(edges["from"])
+        to_ids = self._decode_node_ids(edges["to"])
+        # Edges between communities can weigh more than any single edge
+        widths = np.minimum(
+            self.graph_whole.get_edge_width(edges["weight"]),
+            self.graph_whole.get_edge_width(self.graph_whole.edge_weight_max),
+        )
+        widths = np.round(widths, 1)
+
+        return [
+            {"from": from_id, "to": to_id, "width": width}
+            for from_id, to_id, width in zip(
+                from_ids.tolist(),
+                to_ids.tolist(),
+                widths.tolist(),
+            )
         ]
 
+    def _get_display_edge_keys(self):
+        """
+        One int64 per edge of graph_display, combining its from and to node ids
+        """
+        edges = self.graph_display.edges
+        return (edges["from"].to_numpy().astype(np.int64) << 32) | edges[
+            "to"
+        ].to_numpy()
+
+    def create_visddc_network(self):
+        """
+        The whole of graph_display as data for the visdcc network.
+        Also records what has been rendered, for create_visdcc_network_update.
+        """
+        if self.graph_display.nodes is None or self.graph_display.edges is None:
+            graph_data = {"nodes": {}, "edges": {}}
+            return graph_data
+
+        self.rendered_node_ids = set(self.graph_display.nodes["id"].tolist())
+        self.rendered_edge_ids = set(self._get_display_edge_keys().tolist())
+        # Changes to graph with collapsed communities are always rendered in full
+        self.needs_full_render = len(self.collapsed_communities) > 0
+
+        graph = self._get_visible_display_graph()
+        coordinates = self.node_layout.place_graph(graph)
+        is_community = graph.nodes["id"].to_numpy() < 0
+        nodes = self._create_visdcc_nodes(
+            graph.nodes[~is_community], coordinates[~is_community]
+        )
+        if is_community.any():
+            nodes += self._create_visdcc_community_nodes(
+                graph.nodes[is_community], coordinates[is_community]
+            )
+        edges = self._create_visdcc_edges(graph.edges)
+
         graph_data = {"nodes": nodes, "edges": edges}
 
         return graph_data
 
-    def delete_node_from_display_graph(self, node_id):
-        self.graph_display.delete_node_from_graph(node_id)
+    def create_visdcc_network_update(self):
+        """
+        The nodes and edges that have been added to or removed from graph_display since the last
+        render, so that only these have to be sent to the visdcc network. Removed edges are
+        given as [from, to] pairs.
+        Returns None if the network has to be rendered in full with create_visddc_network.
+        """
+        if self.needs_full_render or self.graph_display.nodes is None:
+            return None
+
+        nodes = self.graph_display.nodes
+        edges = self.graph_display.edges
+        node_ids = nodes["id"].tolist()
+        edge_keys = self._get_display_edge_keys().tolist()
+
+        is_new_node = ~nodes["id"].isin(self.rendered_node_ids).to_numpy()
+        new_nodes = nodes[is_new_node]
+        # Only the new nodes are placed, around their neighbors that are already rendered
+        new_coordinates = self.node_layout.place_graph(self.graph_display)[is_new_node]
+        new_edges = edges[~pd.Series(edge_keys).isin(self.rendered_edge_ids).to_numpy()]
+        removed_node_ids = np.array(list(self.rendered_node_ids.difference(node_ids)))
+        removed_edge_keys = np.array(
+            list(self.rendered_edge_ids.difference(edge_keys)), dtype=np.int64
+        )
+
+        self.rendered_node_ids = set(node_ids)
+        self.rendered_edge_ids = set(edge_keys)
+
+        removed_edges = zip(
+            self._decode_node_ids(removed_edge_keys >> 32).tolist(),
+            self._decode_node_ids(removed_edge_keys & 0xFFFFFFFF).tolist(),
+        )
+        return {
+            "nodes_added": self._create_visdcc_nodes(new_nodes, new_coordinates),
+            "nodes_removed": self.node_names.decode(
+                removed_node_ids.astype(np.int64)
+            ).tolist(),
+            "edges_added": self._create_visdcc_edges(new_edges),
+            "edges_removed": [list(edge) for edge in removed_edges],
+        }
 
     def create_datatable_to_display(self):
-        data_to_display = self.graph_display.graph_summary_table
+        graph_summary = self.graph_display.get_graph_summary()
+        if graph_summary is None:
+            return []
 
         fields_to_display = [
             "Number of nodes",
@@ -131,9 +672,13 @@ class GraphData:
             "weight_sum",
             "weight_median",
         ]
-        mask = data_to_display["Field Description"].isin(fields_to_display)
+        return graph_summary.to_records(fields_to_display)
 
-        data_to_display = data_to_display[mask]
-        data_to_display = data_to_display.to_dict("records")
 
-        return data_to_display
+@lru_cache(maxsize=None)
+def get_shared_graph_data():
+    """
+    The GraphData of this process. It is loaded on first use and shared by layout.py and
+    callbacks.py, so the data is only loaded once.
+    """
+    return GraphData()
@@ -1,16 +1,265 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
 import pandas as pd
-from config import NODE_PATH, EDGE_PATH
+from pandas.api.types import union_categoricals
+from .string_table import StringTable
+from .sources import open_source, NODE_COLUMNS, EDGE_COLUMNS
+from config import NODE_PATH, EDGE_PATH, CACHE_PATH, LOAD_CHUNK_SIZE
+
+# Increment when the format of the cached data changes, to invalidate existing caches
+CACHE_FORMAT_VERSION = 3
+
+
+def _create_cache_key(*paths):
+    """
+    Identifies the version of the source files, from their paths, sizes and modification times
+    """
+    source_files = [
+        (os.path.abspath(path), os.stat(path).st_size, os.stat(path).st_mtime_ns)
+        for path in paths
+    ]
+    key = json.dumps([CACHE_FORMAT_VERSION, source_files])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _compact_node_chunk(chunk):
+    return pd.DataFrame(
+        {
+            "id": chunk["id"].astype(object),
+            "gender": chunk["gender"].astype("category"),
+            "screentime": chunk["screentime"].astype(np.float64),
+        }
+    )
+
+
+def _concatenate_node_chunks(chunks):
+    """
+    The node chunks from _compact_node_chunk as one frame, sorted by screentime
+    """
+    chunks = list(chunks)
+    nodes = pd.DataFrame(
+        {
+            "id": np.concatenate([chunk["id"].to_numpy() for chunk in chunks]),
+            "gender": union_categoricals(
+                [chunk["gender"] for chunk in chunks], sort_categories=True
+            ),
+            "screentime": np.concatenate(
+                [chunk["screentime"].to_numpy() for chunk in chunks]
+            ),
+        }
+    )
+    return nodes.sort_values(by=["screentime"], ascending=False)
+
+
+class _EdgeAggregator:
+    """
+    Sums the weights of edges with the same from and to node ids as they are streamed in
+    chunks, so memory grows with the number of distinct edges rather than the number of rows.
+    The position of the first row of each edge is kept, so the edges keep the order of the
+    source.
+    """
+
+    def __init__(self):
+        self.num_rows = 0
+        self._keys = []
+        self._weights = []
+        self._first_rows = []
+        self._num_pending = 0
+        self._num_merged = 0
+
+    def add(self, from_ids, to_ids, weights):
+        keys = (from_ids.astype(np.int64) << 32) | to_ids.astype(np.int64)
+        rows = np.arange(self.num_rows, self.num_rows + len(keys))
+        self.num_rows += len(keys)
+        self._append(*self._aggregate(keys, weights.astype(np.float64), rows))
+
+        # Merged when the unmerged edges have doubled, so every edge is merged a logarithmic
+        # number of times
+        if self._num_pending > max(self._num_merged, 1):
+            self._merge()
+
+    def to_frame(self):
+        self._merge()
+        keys, weights, first_rows = self._keys[0], self._weights[0], self._first_rows[0]
+        order = np.argsort(first_rows)
+        return pd.DataFrame(
+            {
+                "from": (keys[order] >> 32).astype(np.int32),
+                "to": (keys[order] & 0xFFFFFFFF).astype(np.int32),
+                "weight": weights[order].astype(np.float32),
+            }
+        )
+
+    @staticmethod
+    def _aggregate(keys, weights, rows):
+        order = np.lexsort((rows, keys))
+        keys = keys[order]
+        starts = np.flatnonzero(np.diff(keys, prepend=-1))
+        return (
+            keys[starts],
+            np.add.reduceat(weights[order], starts) if len(keys) else weights,
+            rows[order][starts],
+        )
+
+    def _append(self, keys, weights, first_rows):
+        self._keys.append(keys)
+        self._weights.append(weights)
+        self._first_rows.append(first_rows)
+        self._num_pending += len(keys)
+
+    def _merge(self):
+        merged = self._aggregate(
+            np.concatenate([np.zeros(0, dtype=np.int64)] + self._keys),
+            np.concatenate([np.zeros(0)] + self._weights),
+            np.concatenate([np.zeros(0, dtype=np.int64)] + self._first_rows),
+        )
+        self._keys, self._weights, self._first_rows = [], [], []
+        self._num_pending = 0
+        self._append(*merged)
+        self._num_merged = self._num_pending
+
+
+def _compact_frames_from_chunks(node_chunks, edge_chunks):
+    """
+    The compact representation of create_compact_frames, from nodes and edges in the schema of
+    the CSV files given as iterables of frames. The edge chunks are converted one at a time.
+    """
+    nodes = _concatenate_node_chunks(
+        _compact_node_chunk(chunk) for chunk in node_chunks
+    )
+    node_names = StringTable(nodes["id"])
+    nodes["id"] = node_names.encode(nodes["id"])
+
+    edge_aggregator = _EdgeAggregator()
+    for chunk in edge_chunks:
+        edge_aggregator.add(
+            node_names.add(chunk["from"]),
+            node_names.add(chunk["to"]),
+            chunk["weight"].to_numpy(),
+        )
+    edges = edge_aggregator.to_frame().sort_values(by=["weight"], ascending=False)
+
+    return nodes.reset_index(drop=True), edges.reset_index(drop=True), node_names
+
+
+def create_compact_frames(nodes, edges):
+    """
+    Convert nodes and edges in the schema of the CSV files to the compact representation used by
+    DFGraph. Node ids are interned in a StringTable and replaced by their int32 codes, weight is
+    float32 and gender is categorical. Edges with the same from and to node are merged into one
+    with their summed weight. Nodes are sorted by screentime and edges by weight, and other
+    columns are dropped.
+    """
+    return _compact_frames_from_chunks([nodes], [edges])
+
+
+def _save_frame(frame, directory):
+    """
+    Save each column of frame as a .npy file that can be memory-mapped.
+    Categorical columns are saved as their codes, with the categories in columns.json.
+    """
+    os.makedirs(directory)
+    categories = {}
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories[column] = values.cat.categories.to_list()
+            values = values.cat.codes
+        np.save(os.path.join(directory, f"{column}.npy"), values.to_numpy())
+
+    with open(os.path.join(directory, "columns.json"), "w") as file:
+        json.dump({"columns": list(frame.columns), "categories": categories}, file)
+
+
+def _load_frame(directory):
+    with open(os.path.join(directory, "columns.json")) as file:
+        metadata = json.load(file)
+
+    frame = {}
+    for column in metadata["columns"]:
+        values = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+        if column in metadata["categories"]:
+            values = pd.Categorical.from_codes(
+                values, categories=metadata["categories"][column]
+            )
+        frame[column] = values
+    return pd.DataFrame(frame)
+
+
+def _read_sources():
+    node_source = open_source(NODE_PATH, LOAD_CHUNK_SIZE)
+    edge_source = open_source(EDGE_PATH, LOAD_CHUNK_SIZE)
+    return _compact_frames_from_chunks(
+        node_source.read_chunks(NODE_COLUMNS), edge_source.read_chunks(EDGE_COLUMNS)
+    )
 
 
 def load_got():
     """
-    Load the data into pandas dataframes
+    Load the data into pandas dataframes in the compact representation of create_compact_frames.
+    NODE_PATH and EDGE_PATH are read in chunks of LOAD_CHUNK_SIZE rows by the source for their
+    file type, see sources.open_source, so edge lists larger than memory can be loaded as long
+    as their distinct edges fit. The compact data is cached as columnar .npy files under
+    CACHE_PATH, keyed by the sizes and modification times of the source files, so they are only
+    parsed when they change.
     """
+    cache_key = _create_cache_key(NODE_PATH, EDGE_PATH)
+    cache_directory = os.path.join(CACHE_PATH, cache_key)
+
+    if os.path.isdir(cache_directory):
+        nodes = _load_frame(os.path.join(cache_directory, "nodes"))
+        edges = _load_frame(os.path.join(cache_directory, "edges"))
+        node_names = StringTable(
+            np.load(os.path.join(cache_directory, "node_names.npy"))
+        )
+        return nodes, edges, node_names
 
-    nodes = pd.read_csv(NODE_PATH)
-    edges = pd.read_csv(EDGE_PATH)
+    nodes, edges, node_names = _read_sources()
 
-    nodes = nodes.sort_values(by=["screentime"], ascending=False)
-    edges = edges.sort_values(by=["weight"], ascending=False)
+    # Written to a temporary directory and renamed, so a half written cache is never read
+    temporary_directory = f"{cache_directory}.{os.getpid()}.tmp"
+    shutil.rmtree(temporary_directory, ignore_errors=True)
+    _save_frame(nodes, os.path.join(temporary_directory, "nodes"))
+    _save_frame(edges, os.path.join(temporary_directory, "edges"))
+    np.save(
+        os.path.join(temporary_directory, "node_names.npy"),
+        node_names.strings.astype(str),
+    )
+    try:
+        os.replace(temporary_directory, cache_directory)
+    except OSError:
+        # Another process wrote the same cache first
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+
+    # Remove caches of previous versions of the CSV files
+    for name in os.listdir(CACHE_PATH):
+        if name != cache_key and not name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(CACHE_PATH, name), ignore_errors=True)
+
+    return nodes, edges, node_names
+
+
+def load_cached_arrays(name, version, create_arrays):
+    """
+    Arrays derived from the data loaded by load_got, cached next to it so they are computed
+    once per version of the CSV files. create_arrays returns a dict of arrays by name, and is
+    only called when they are not cached yet. version identifies the code and parameters of
+    create_arrays, e.g. a version number and the parameters from config, and is part of the
+    cache key along with name.
+    """
+    cache_directory = os.path.join(CACHE_PATH, _create_cache_key(NODE_PATH, EDGE_PATH))
+    version_key = hashlib.sha1(json.dumps(version).encode()).hexdigest()[:16]
+    path = os.path.join(cache_directory, f"{name}_{version_key}.npz")
+    if os.path.exists(path):
+        with np.load(path) as arrays:
+            return {array_name: arrays[array_name] for array_name in arrays.files}
 
-    return nodes, edges
+    arrays = create_arrays()
+    if os.path.isdir(cache_directory):
+        temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary_path, **arrays)
+        os.replace(temporary_path, path)
+    return arrays
@@ -0,0 +1,151 @@
+import re
+from dataclasses import dataclass
+import numpy as np
+from .utils import concatenate_ranges
+
+# Characters other than letters and digits separate words, e.g. the dash in "Jon-Snow"
+WORD_SEPARATOR = re.compile(r"[^0-9a-z]+")
+# Codepoints are below 2**21, so three of them fit in one int64 trigram code
+CODEPOINT_BITS = 21
+SPACE = ord(" ")
+
+
+def normalize_name(name):
+    """
+    Lowercase name with its words separated by single spaces, so "jon snow" finds "Jon-Snow"
+    """
+    return WORD_SEPARATOR.sub(" ", str(name).lower()).strip()
+
+
+def _get_trigram_codes(padded_names):
+    """
+    Trigram codes of every name in padded_names, and the index of the name of each
+    """
+    padded_names = np.asarray(padded_names, dtype=str)
+    if padded_names.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    codepoints = (
+        padded_names.view(np.uint32).reshape(len(padded_names), -1).astype(np.int64)
+    )
+    codes = (
+        (codepoints[:, :-2] << (2 * CODEPOINT_BITS))
+        | (codepoints[:, 1:-1] << CODEPOINT_BITS)
+        | codepoints[:, 2:]
+    )
+    # Names are padded with zeros to the longest name. Trigrams ending in two spaces are
+    # between words.
+    lengths = np.char.str_len(padded_names)
+    is_trigram = np.arange(codes.shape[1]) < (lengths - 2)[:, None]
+    is_trigram &= (codepoints[:, 1:-1] != SPACE) | (codepoints[:, 2:] != SPACE)
+    rows = np.broadcast_to(np.arange(len(padded_names))[:, None], codes.shape)
+    return codes[is_trigram], rows[is_trigram]
+
+
+def _pad_for_trigrams(normalized_name):
+    # Padding gives the start and end of every word trigrams of their own, as in pg_trgm
+    return "".join(f"  {word} " for word in normalized_name.split(" "))
+
+
+@dataclass
+class NodeSearchIndex:
+    """
+    Search over node names for the node dropdowns, built once and shared by all sessions.
+    Names are matched by prefix, of the whole name or of one of its words, and otherwise by
+    the share of the trigrams of the query they contain, so misspelled names are found as
+    well. Matches are ranked by a score per node, e.g. screentime.
+
+    Nodes are numbered in order of decreasing score, so ranking by score is sorting by number.
+    The prefix index is a flattened trie: the sorted normalized names and their word suffixes,
+    where the entries starting with a prefix are one searchsorted range.
+    """
+
+    # Name of each node, in order of decreasing score
+    names: np.ndarray
+
+    # Sorted prefix entries, the node of each, and whether it starts at a later word
+    prefixes: np.ndarray
+    prefix_nodes: np.ndarray
+    prefix_is_word: np.ndarray
+
+    # Sorted trigram codes and the node of each
+    trigrams: np.ndarray
+    trigram_nodes: np.ndarray
+
+    def __init__(self, names, scores):
+        order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+        self.names = np.asarray(names, dtype=object)[order]
+        normalized_names = [normalize_name(name) for name in self.names]
+
+        prefixes = list(normalized_names)
+        prefix_nodes = list(range(len(normalized_names)))
+        for node, normalized_name in enumerate(normalized_names):
+            start = normalized_name.find(" ")
+            while start >= 0:
+                prefixes.append(normalized_name[start + 1 :])
+                prefix_nodes.append(node)
+                start = normalized_name.find(" ", start + 1)
+        order = sorted(range(len(prefixes)), key=prefixes.__getitem__)
+        self.prefixes = np.array(prefixes, dtype=object)[order]
+        self.prefix_nodes = np.array(prefix_nodes, dtype=np.int64)[order]
+        # The whole names are listed first
+        self.prefix_is_word = np.array(order) >= len(normalized_names)
+
+        codes, nodes = _get_trigram_codes(
+            [_pad_for_trigrams(name) for name in normalized_names]
+        )
+        # Trigrams are listed in order of their node, which the stable sort keeps. Each is
+        # listed once per node.
+        order = np.argsort(codes, kind="stable")
+        codes, nodes = codes[order], nodes[order]
+        is_first = np.ones(len(codes), dtype=bool)
+        is_first[1:] = (codes[1:] != codes[:-1]) | (nodes[1:] != nodes[:-1])
+        self.trigrams = codes[is_first]
+        self.trigram_nodes = nodes[is_first]
+
+    def _search_prefix(self, query):
+        """
+        Nodes with a name or word starting with query, those whose name does first
+        """
+        start = np.searchsorted(self.prefixes, query, side="left")
+        stop = np.searchsorted(self.prefixes, query + "\U0010ffff", side="left")
+        # Nodes are ranked by number, after those matching the whole name
+        keys = np.unique(
+            self.prefix_nodes[start:stop]
+            + self.prefix_is_word[start:stop] * len(self.names)
+        )
+        nodes = keys % len(self.names)
+        _, first = np.unique(nodes, return_index=True)
+        return nodes[np.sort(first)]
+
+    def _search_trigrams(self, query, min_similarity):
+        """
+        Nodes whose name contains at least the share min_similarity of the trigrams of query,
+        the most similar first
+        """
+        query_codes, _ = _get_trigram_codes([_pad_for_trigrams(query)])
+        query_codes = np.unique(query_codes)
+        starts = np.searchsorted(self.trigrams, query_codes, side="left")
+        stops = np.searchsorted(self.trigrams, query_codes, side="right")
+        nodes, shared = np.unique(
+            self.trigram_nodes[concatenate_ranges(starts, stops)], return_counts=True
+        )
+        similarity = shared / max(len(query_codes), 1)
+        is_similar = similarity >= min_similarity
+        nodes, similarity = nodes[is_similar], similarity[is_similar]
+        return nodes[np.lexsort((nodes, -similarity))]
+
+    def search(self, query, max_results, min_similarity):
+        """
+        Names of at most max_results nodes matching query: prefix matches first, then similar
+        names. All names match an empty query.
+        """
+        query = normalize_name(query or "")
+        if query == "":
+            return self.names[:max_results].tolist()
+
+        nodes = self._search_prefix(query)[:max_results]
+        if len(nodes) < max_results:
+            similar_nodes = self._search_trigrams(query, min_similarity)
+            similar_nodes = similar_nodes[~np.isin(similar_nodes, nodes)]
+            nodes = np.concatenate([nodes, similar_nodes])[:max_results]
+        return self.names[nodes].tolist()
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import threading
+import flask
+import numpy as np
+import pandas as pd
+
+# Written by download_portraits.create_thumbnails in the thumbnail directory
+THUMBNAIL_MANIFEST_NAME = "manifest.json"
+
+# Node sizes are radii, so a node is drawn 2 * size pixels wide, which is doubled again to
+# stay sharp on screens of double pixel density
+THUMBNAIL_PIXELS_PER_NODE_SIZE = 4
+
+# Portraits are served under this path with the hash of their content as file name, so their
+# URLs change when they change and browsers can cache them forever
+PORTRAIT_URL_PATH = "/portraits"
+PORTRAIT_MAX_AGE_SECONDS = 365 * 24 * 60 * 60
+
+
+class PortraitManifest:
+    """
+    In-memory map from node id to the URL of its portrait in image_directory, and of its
+    thumbnails in thumbnail_directory, so that image URLs can be resolved without touching the
+    filesystem. Nodes without a portrait are shown with the image at fallback_path.
+    URLs are content-hashed, see register_route for how they are served.
+    The directory and the thumbnail manifest are read on creation and by refresh().
+    start_watching() starts a background thread that refreshes the manifest when the contents
+    of the directory or the thumbnail manifest change.
+    """
+
+    def __init__(self, image_directory, thumbnail_directory=None, fallback_path=None):
+        self.image_directory = image_directory
+        self.thumbnail_directory = thumbnail_directory
+        self.fallback_path = fallback_path
+        self.image_paths = {}
+        # Thumbnail size -> node id -> URL, for the sizes in increasing order
+        self.thumbnail_paths = {}
+        self.fallback_url = None
+        self._modification_times = None
+        # Served file name -> path of the file
+        self._files = {}
+        # Path -> (size, modification time, hash), so unchanged files are not hashed again
+        self._file_hashes = {}
+        self._watcher = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Rescan image_directory, e.g. after new portraits have been downloaded
+        """
+        self._modification_times = self._get_modification_times()
+        files = {}
+        image_paths = {}
+        try:
+            with os.scandir(self.image_directory) as entries:
+                for entry in entries:
+                    node_id, extension = os.path.splitext(entry.name)
+                    if extension == ".png":
+                        image_paths[node_id] = self._add_file(files, entry.path)
+        except FileNotFoundError:
+            pass
+
+        thumbnail_paths = {}
+        for size, paths in self._read_thumbnail_manifest().items():
+            thumbnail_paths[size] = {
+                node_id: self._add_file(files, path) for node_id, path in paths.items()
+            }
+
+        fallback_url = None
+        if self.fallback_path is not None and os.path.exists(self.fallback_path):
+            fallback_url = self._add_file(files, self.fallback_path)
+
+        # Replaced in one assignment each, so readers never see a partially built manifest.
+        # Files are replaced first, so every URL handed out can be served.
+        self._files = files
+        self.image_paths = image_paths
+        self.thumbnail_paths = thumbnail_paths
+        self.fallback_url = fallback_url
+
+    def _hash_file(self, path):
+        status = os.stat(path)
+        cached = self._file_hashes.get(path)
+        if cached is not None and cached[:2] == (status.st_size, status.st_mtime_ns):
+            return cached[2]
+        with open(path, "rb") as file:
+            file_hash = hashlib.sha1(file.read()).hexdigest()[:20]
+        self._file_hashes[path] = (status.st_size, status.st_mtime_ns, file_hash)
+        return file_hash
+
+    def _add_file(self, files, path):
+        """
+        Add the file at path to files under its content-hashed name, and return its URL
+        """
+        file_name = self._hash_file(path) + os.path.splitext(path)[1]
+        files[file_name] = os.path.abspath(path)
+        return f"{PORTRAIT_URL_PATH}/{file_name}"
+
+    def _get_thumbnail_manifest_path(self):
+        return os.path.join(self.thumbnail_directory, THUMBNAIL_MANIFEST_NAME)
+
+    def _read_thumbnail_manifest(self):
+        if self.thumbnail_directory is None:
+            return {}
+        try:
+            with open(self._get_thumbnail_manifest_path()) as file:
+                portraits = json.load(file)["portraits"]
+        except FileNotFoundError:
+            return {}
+
+        thumbnail_paths = {}
+        for node_id, entry in portraits.items():
+            for size, path in entry["thumbnails"].items():
+                thumbnail_paths.setdefault(int(size), {})[node_id] = os.path.join(
+                    self.thumbnail_directory, path
+                )
+        return dict(sorted(thumbnail_paths.items()))
+
+    def get_image_paths(self, node_ids, node_sizes=None):
+        """
+        URL of the portrait of each node id, or fallback_url if it has no portrait, or None if
+        there is no fallback image either.
+        If node_sizes are given, the smallest thumbnail that is sharp at the node size is used
+        instead, or the largest if none is.
+        """
+        paths = node_ids.map(self.image_paths).to_numpy(dtype=object)
+        thumbnail_paths = self.thumbnail_paths
+        if node_sizes is not None and thumbnail_paths:
+            sizes = list(thumbnail_paths)
+            pixels = np.asarray(node_sizes) * THUMBNAIL_PIXELS_PER_NODE_SIZE
+            size_indices = np.minimum(np.searchsorted(sizes, pixels), len(sizes) - 1)
+            for size_index, size in enumerate(sizes):
+                thumbnails = node_ids.map(thumbnail_paths[size]).to_numpy(dtype=object)
+                is_used = (size_indices == size_index) & pd.notna(thumbnails)
+                paths[is_used] = thumbnails[is_used]
+        paths = pd.Series(paths, index=node_ids.index)
+        # fillna refuses None, which is what a missing fallback image is set to instead
+        if self.fallback_url is None:
+            return paths.astype(object).where(paths.notna(), None)
+        return paths.fillna(self.fallback_url)
+
+    def register_route(self, server):
+        """
+        Serve the portraits on the flask server of the app. A URL always refers to the same
+        content, so responses may be cached forever, and are revalidated by ETag otherwise.
+        """
+
+        def portrait(file_name):
+            path = self._files.get(file_name)
+            if path is None:
+                flask.abort(404)
+            response = flask.send_file(
+                path,
+                etag=os.path.splitext(file_name)[0],
+                max_age=PORTRAIT_MAX_AGE_SECONDS,
+                conditional=True,
+            )
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+            return response
+
+        server.add_url_rule(f"{PORTRAIT_URL_PATH}/<file_name>", "portrait", portrait)
+
+    def _get_modification_times(self):
+        paths = [self.image_directory]
+        if self.thumbnail_directory is not None:
+            paths.append(self._get_thumbnail_manifest_path())
+
+        modification_times = []
+        for path in paths:
+            try:
+                modification_times.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                modification_times.append(None)
+        return tuple(modification_times)
+
+    def _has_changed(self):
+        return self._get_modification_times() != self._modification_times
+
+    def _watch(self, interval_seconds):
+        # Adding, removing or renaming a file updates the modification time of the directory,
+        # and the thumbnail manifest is replaced when thumbnails are created
+        while not self._stop_watching.wait(interval_seconds):
+            if self._has_changed():
+                self.refresh()
+
+    def start_watching(self, interval_seconds):
+        if self._watcher is not None:
+            return
+        self._stop_watching = threading.Event()
+        self._watcher = threading.Thread(
+            target=self._watch, args=(interval_seconds,), daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is None:
+            return
+        self._stop_watching.set()
+        self._watcher.join()
+        self._watcher = None
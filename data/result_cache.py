@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class ResultCache:
+    """
+    Least recently used cache of computed results, e.g. filtered graphs, shared between
+    sessions. The least recently used results are evicted when there are more than
+    max_entries, or when their total memory usage, measured with memory_usage(result),
+    exceeds max_bytes. Counts hits and misses.
+    """
+
+    def __init__(self, max_entries, max_bytes, memory_usage):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.measure_memory_usage = memory_usage
+        self.hits = 0
+        self.misses = 0
+
+        # key -> [result, memory_usage], in least recently used order
+        self._entries = OrderedDict()
+        self._memory_usage = 0
+        self._lock = Lock()
+
+    def get(self, key, create_result):
+        """
+        The cached result for key, or else the result of create_result(), which is cached.
+        create_result is called without holding the lock, so a slow computation does not
+        block other sessions.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        result = create_result()
+        self.put(key, result)
+        return result
+
+    def put(self, key, result):
+        memory_usage = self.measure_memory_usage(result)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = [result, memory_usage]
+            self._memory_usage += memory_usage
+            self._evict_least_recently_used()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory_usage(self):
+        return self._memory_usage
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_usage = 0
+
+    def _remove(self, key):
+        _, memory_usage = self._entries.pop(key)
+        self._memory_usage -= memory_usage
+
+    def _evict_least_recently_used(self):
+        # The most recently added result is kept, even if it alone exceeds max_bytes
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._memory_usage > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
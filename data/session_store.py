@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+
+class SessionStore:
+    """
+    Server side store of per-session state, e.g. one GraphData per browser tab.
+    Sessions are kept in least recently used order, and the least recently used sessions are
+    evicted when there are more than max_sessions, when their total memory usage exceeds
+    max_bytes, or when they have not been used for ttl_seconds.
+    An evicted session is recreated with create_session the next time it is used.
+    """
+
+    def __init__(self, create_session, max_sessions, max_bytes, ttl_seconds):
+        self.create_session = create_session
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # session_id -> [session, memory_usage, last_access_time, session_lock], in least
+        # recently used order
+        self._sessions = OrderedDict()
+        self._memory_usage = 0
+        self._lock = Lock()
+
+    @contextmanager
+    def use(self, session_id):
+        """
+        Context manager giving the session of session_id, and whether it was created for this
+        use, because it is new or was evicted. The lock of the session is held until the
+        context exits, so concurrent requests of one session use it one at a time.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+
+            is_new_session = session_id not in self._sessions
+            if is_new_session:
+                entry = [self.create_session(), 0, now, Lock()]
+                self._sessions[session_id] = entry
+            else:
+                self._sessions.move_to_end(session_id)
+                entry = self._sessions[session_id]
+            entry[2] = now
+
+        with entry[3]:
+            yield entry[0], is_new_session
+
+            # The session may have been changed, so it is measured again
+            memory_usage = entry[0].memory_usage()
+
+        with self._lock:
+            # The session may have been evicted while it was used
+            if self._sessions.get(session_id) is entry:
+                self._memory_usage += memory_usage - entry[1]
+                entry[1] = memory_usage
+                self._evict_least_recently_used()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def memory_usage(self):
+        return self._memory_usage
+
+    def _remove(self, session_id):
+        _, memory_usage, _, _ = self._sessions.pop(session_id)
+        self._memory_usage -= memory_usage
+
+    def _evict_expired(self, now):
+        while self._sessions:
+            session_id, (_, _, last_access_time, _) = next(iter(self._sessions.items()))
+            if now - last_access_time <= self.ttl_seconds:
+                break
+            self._remove(session_id)
+
+    def _evict_least_recently_used(self):
+        # The most recently used session is never evicted, even if it alone exceeds max_bytes
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions
+            or self._memory_usage > self.max_bytes
+        ):
+            self._remove(next(iter(self._sessions)))
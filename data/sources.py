@@ -0,0 +1,89 @@
+import os
+import pandas as pd
+
+# The columns read from the node and edge sources, other columns are not materialized
+NODE_COLUMNS = ["id", "gender", "screentime"]
+EDGE_COLUMNS = ["from", "to", "weight"]
+
+
+class CsvSource:
+    """
+    A CSV file, read in chunks of chunk_size rows
+    """
+
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def read_chunks(self, columns):
+        """
+        Frames of at most chunk_size rows with only the given columns
+        """
+        with pd.read_csv(
+            self.path, usecols=columns, chunksize=self.chunk_size
+        ) as chunks:
+            yield from chunks
+
+
+class ParquetSource:
+    """
+    A Parquet file, read in record batches of chunk_size rows. Requires pyarrow.
+    """
+
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def read_chunks(self, columns):
+        import pyarrow.parquet
+
+        parquet_file = pyarrow.parquet.ParquetFile(self.path)
+        # Only the projected columns are decoded
+        for batch in parquet_file.iter_batches(
+            batch_size=self.chunk_size, columns=columns
+        ):
+            yield batch.to_pandas()
+
+
+class ArrowSource:
+    """
+    An Arrow IPC (Feather version 2) file, memory-mapped and read one record batch at a time.
+    Requires pyarrow.
+    """
+
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def read_chunks(self, columns):
+        import pyarrow
+        import pyarrow.ipc
+
+        with pyarrow.memory_map(self.path) as file:
+            reader = pyarrow.ipc.open_file(file)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for start in range(0, batch.num_rows, self.chunk_size):
+                    yield batch.slice(start, self.chunk_size).to_pandas()
+
+
+# Source type of each file extension. Other formats are supported by adding a class with the
+# same constructor and read_chunks method.
+SOURCE_TYPES = {
+    ".csv": CsvSource,
+    ".parquet": ParquetSource,
+    ".arrow": ArrowSource,
+    ".feather": ArrowSource,
+}
+
+
+def open_source(path, chunk_size):
+    """
+    The source reading the file at path, by its extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SOURCE_TYPES:
+        raise ValueError(
+            f"Unsupported data file {path}, expected one of {', '.join(SOURCE_TYPES)}"
+        )
+    return SOURCE_TYPES[extension](path, chunk_size)
@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class StringTable:
+    """
+    Interned strings: every distinct string is stored once, and referred to by its int32 code,
+    which is its position in strings.
+    """
+
+    strings: np.ndarray
+
+    def __init__(self, strings):
+        self.strings = np.asarray(pd.unique(np.asarray(strings, dtype=object)))
+        self._index = pd.Index(self.strings)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def encode(self, strings):
+        """
+        Codes of strings, -1 for strings that are not in the table
+        """
+        return self._index.get_indexer(strings).astype(np.int32)
+
+    def add(self, strings):
+        """
+        Codes of strings, adding the strings that are not in the table yet
+        """
+        strings = np.asarray(strings, dtype=object)
+        codes = self.encode(strings)
+        is_new = codes < 0
+        if is_new.any():
+            new_strings = np.asarray(pd.unique(strings[is_new]))
+            self.strings = np.concatenate([self.strings, new_strings])
+            self._index = self._index.append(pd.Index(new_strings))
+            codes[is_new] = self.encode(strings[is_new])
+        return codes
+
+    def encode_one(self, string):
+        return int(self.encode([string])[0])
+
+    def decode(self, codes):
+        return self.strings[np.asarray(codes)]
+
+    def decode_one(self, code):
+        return self.strings[code]
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+import numpy as np
 
 
 def calculate_slope(x1, x2, y1, y2):
@@ -6,8 +7,20 @@ def calculate_slope(x1, x2, y1, y2):
     return slope
 
 
+def concatenate_ranges(starts, ends):
+    """
+    Vectorized equivalent of np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+    """
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+
+
 @dataclass
 class GraphFilterParams:
     min_screentime: float
     min_edge_weight: float
     node_types_to_include: list()
+    # A metric of data.centrality.CENTRALITY_METRICS, and the smallest percentile of it
+    centrality_metric: str = None
+    min_centrality_percentile: float = None
@@ -1,130 +1,488 @@
 # %%
-import pandas as pd
+import argparse
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlsplit
+import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from data import load_got
-from PIL import Image
+from PIL import Image, features
+from data.portraits import THUMBNAIL_MANIFEST_NAME
+from config import (
+    NODE_PATH,
+    FILE_PATH_FOR_IMAGES,
+    PORTRAIT_THUMBNAIL_DIRECTORY,
+    PORTRAIT_THUMBNAIL_SIZES,
+    PORTRAIT_CROP_FRACTION,
+    PORTRAIT_WIKI_BASE_URL,
+    PORTRAIT_STATE_PATH,
+    PORTRAIT_DOWNLOAD_WORKERS,
+    PORTRAIT_REQUESTS_PER_SECOND_PER_HOST,
+    PORTRAIT_DOWNLOAD_RETRIES,
+    PORTRAIT_DOWNLOAD_TIMEOUT_SECONDS,
+)
 
-DATA_PATH = os.path.join(os.getcwd(), "data")
-NODE_PATH = os.path.join(DATA_PATH, "got_nodes.csv")
-EDGE_PATH = os.path.join(DATA_PATH, "got_edges.csv")
-FILE_PATH_FOR_IMAGE_URLS = "data/image_urls.csv"
-FILE_PATH_FOR_IMAGES = "assets/portrait_images"
+# Responses that are retried, other error responses fail at once
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_BACKOFF_SECONDS = 1.0
+STATE_SAVE_INTERVAL_SECONDS = 5
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "PNG"
 
 
-def create_url_from_node_name(node_name):
+def create_url_from_node_name(node_name, base_url=PORTRAIT_WIKI_BASE_URL):
     node_name = node_name.replace("-", "_")
-    url = f"""https://gameofthrones.fandom.com/wiki/{node_name}"""
+    url = f"""{base_url.rstrip("/")}/wiki/{node_name}"""
     return url
 
 
-def create_wiki_urls(nodes):
+def create_wiki_urls(nodes, base_url=PORTRAIT_WIKI_BASE_URL):
     """
-    Load the data into pandas dataframes
+    Add the url of the wiki page of each node
     """
-    nodes["url"] = nodes["id"].apply(create_url_from_node_name)
+    nodes["url"] = nodes["id"].apply(create_url_from_node_name, base_url=base_url)
 
     return nodes
 
 
-def get_image_url(url):
-    try:
-        # Retrieve the HTML content
-        response = requests.get(url)
-        html_content = response.text
+def create_session(max_connections):
+    """
+    A session shared by the download threads, keeping up to max_connections connections
+    per host alive
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=max_connections, pool_maxsize=max_connections
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HostRateLimiter:
+    """
+    Spaces the requests to each host at least 1 / requests_per_second seconds apart, across
+    all threads
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval_seconds = 1 / requests_per_second
+        self._next_request_times = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            request_time = max(now, self._next_request_times.get(host, now))
+            self._next_request_times[host] = request_time + self.interval_seconds
+        time.sleep(request_time - now)
+
+
+class DownloadState:
+    """
+    The progress of a download, saved as JSON in path so an interrupted run resumes where it
+    stopped. For each node id it holds the image_url found on its wiki page and its status:
+    "downloaded", "no_image" if the page has no portrait, or "failed" to retry on the next run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.nodes = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.nodes = json.load(file)
+        self._last_save_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def is_done(self, node_id):
+        return self.nodes.get(node_id, {}).get("status") in ("downloaded", "no_image")
+
+    def get_image_url(self, node_id):
+        return self.nodes.get(node_id, {}).get("image_url")
+
+    def update(self, node_id, **fields):
+        with self._lock:
+            self.nodes[node_id] = {**self.nodes.get(node_id, {}), **fields}
+            if time.monotonic() - self._last_save_time > STATE_SAVE_INTERVAL_SECONDS:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        # Written to a temporary file and renamed, so an interrupted save keeps the old state
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.nodes, file, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+        self._last_save_time = time.monotonic()
+
+
+class PortraitDownloader:
+    """
+    Finds the portrait on the wiki page of a node and downloads it to image_directory.
+    Requests are rate limited per host, time out after timeout_seconds, and are retried up to
+    retries times with exponential backoff on connection errors, timeouts and the responses in
+    RETRY_STATUS_CODES.
+    """
+
+    def __init__(
+        self, session, rate_limiter, retries, timeout_seconds, image_directory
+    ):
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.timeout_seconds = timeout_seconds
+        self.image_directory = image_directory
+
+    def get(self, url):
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait(url)
+            retry_after_seconds = 0.0
+            try:
+                response = self.session.get(url, timeout=self.timeout_seconds)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(
+                    f"{response.status_code} response for {url}", response=response
+                )
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    retry_after_seconds = float(retry_after)
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                error = exception
+
+            if attempt < self.retries:
+                # Jittered, so threads that failed together do not retry together
+                backoff_seconds = (
+                    RETRY_BACKOFF_SECONDS * 2**attempt * random.uniform(1, 2)
+                )
+                time.sleep(max(backoff_seconds, retry_after_seconds))
+        raise error
 
-        # Create a BeautifulSoup object
-        soup = BeautifulSoup(html_content, "html.parser")
+    def get_image_url(self, url):
+        """
+        The url of the portrait on the wiki page at url, an empty string if it has none
+        """
+        soup = BeautifulSoup(self.get(url).text, "html.parser")
 
         # Find the section containing the image
         image_section = soup.find("figure", {"class": "pi-item pi-image"})
+        image = image_section.find("img") if image_section is not None else None
+        if image is None or not image.get("src"):
+            print(f"No portrait found on {url}")
+            return ""
+        return urljoin(url, image["src"])
 
-        # Extract the image URL
-        image_url = image_section.find("img")["src"]
+    def get_image_path(self, node_id):
+        return os.path.join(self.image_directory, f"{node_id}.png")
 
-        return image_url
-    except AttributeError:
-        print(f"AttributeError occurred for the following URL: {url}")
-        print("Returning an empty string.")
-        return ""
+    def download_image(self, image_url, file_name):
+        response = self.get(image_url)
+        # Written to a temporary file and renamed, so a partial download is never served
+        temporary_file_name = f"{file_name}.tmp"
+        with open(temporary_file_name, "wb") as file:
+            file.write(response.content)
+        os.replace(temporary_file_name, file_name)
 
+    def download_portrait(self, node_id, url, state: DownloadState):
+        """
+        Download the portrait of node_id, whose wiki page is at url. The image url is taken
+        from state if the page was read in an earlier run. Returns "downloaded",
+        "already_downloaded" if the portrait was downloaded before, or "no_image".
+        """
+        image_url = state.get_image_url(node_id)
+        if image_url is None:
+            image_url = self.get_image_url(url)
+            state.update(node_id, image_url=image_url)
 
-def add_image_urls_to_nodes_file(nodes):
-    nodes["image_url"] = None
-    for id, row in nodes.iterrows():
-        url = row["url"]
-        print(f"Processing url: {url}")
-        image_url = get_image_url(url)
-        nodes.loc[id, "image_url"] = image_url
+        if image_url == "":
+            state.update(node_id, status="no_image")
+            return "no_image"
 
-    return nodes
+        file_name = self.get_image_path(node_id)
+        if os.path.exists(file_name):
+            status = "already_downloaded"
+        else:
+            self.download_image(image_url, file_name)
+            status = "downloaded"
+        state.update(node_id, status="downloaded")
+        return status
 
 
-def download_images(nodes):
-    for id, row in nodes.iterrows():
-        image_url = row["image_url"]
-        node_id = row["id"]
-        file_name = os.path.join(FILE_PATH_FOR_IMAGES, f"{node_id}.png")
-        print(f"Processing Node id: {node_id}")
-        if image_url != "" and not os.path.exists(file_name):
+def download_portraits(nodes, downloader: PortraitDownloader, state, num_workers):
+    """
+    Download the portraits of the nodes that are not done in state, num_workers at a time.
+    Returns nodes with the column image_url.
+    """
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(
+                downloader.download_portrait, row.id, row.url, state
+            ): row.id
+            for row in nodes.itertuples()
+            if not state.is_done(row.id)
+        }
+        print(f"Downloading {len(futures)} of {len(nodes)} portraits")
+        for i, future in enumerate(as_completed(futures)):
+            node_id = futures[future]
             try:
-                response = requests.get(image_url)
-                # Check if the request was successful (status code 200)
-                if response.status_code == 200:
-                    # Save the image content to a file
-                    with open(file_name, "wb") as file:
-                        file.write(response.content)
-                    print("Image downloaded successfully!")
-                else:
-                    print(
-                        f"Failed to download the image. response.status_code = {response.status_code}"
-                    )
-            except:
-                print("Failed to download the image. requests.get(image_url) failed")
+                status = future.result()
+            except requests.RequestException as exception:
+                state.update(node_id, status="failed")
+                status = f"failed: {exception}"
+            print(f"[{i + 1}/{len(futures)}] {node_id}: {status}")
+    state.save()
+
+    nodes["image_url"] = [state.get_image_url(node_id) or "" for node_id in nodes["id"]]
+    return nodes
 
 
 # %%
-def crop_images(directory, fraction_to_keep):
+def _hash_file(path):
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def _save_image(image, path, format):
+    # Written to a temporary file and renamed, so a partially written image is never served
+    temporary_path = f"{path}.tmp"
+    image.save(temporary_path, format=format)
+    os.replace(temporary_path, path)
+
+
+def create_portrait_thumbnails(
+    node_id, source_path, thumbnail_directory, sizes, crop_fraction
+):
     """
-    Cropping of a part of the bottom of images in the directory to make the faces in the image become more in the center.
-    This function was written by chatGPT with no edits required!!! :D
+    Create the thumbnails of the portrait of node_id at source_path: squares of each of sizes
+    pixels, cut from the top of the portrait where the face is. If crop_fraction is given, the
+    bottom of the portrait is first cropped off to keep crop_fraction of its height, which
+    makes the faces in the image become more in the center. The portrait itself is not
+    changed.
+    Returns the hash of the portrait and the thumbnail paths relative to thumbnail_directory,
+    by size.
     """
-    # Get a list of all files in the directory
-    file_list = os.listdir(directory)
+    source_hash = _hash_file(source_path)
+    with Image.open(source_path) as image:
+        image.load()
+    if crop_fraction is not None:
+        width, height = image.size
+        image = image.crop((0, 0, width, int(height * crop_fraction)))
 
-    # Filter the list to include only PNG files
-    png_files = [f for f in file_list if f.endswith(".png")]
+    width, height = image.size
+    side = min(width, height)
+    left = (width - side) // 2
+    square = image.crop((left, 0, left + side, side))
+    if square.mode not in ("RGB", "RGBA"):
+        square = square.convert("RGBA")
 
-    # Process each PNG file
-    for file_name in png_files:
-        # Open the image
-        image_path = os.path.join(directory, file_name)
-        image = Image.open(image_path)
+    thumbnail_paths = {}
+    for size in sizes:
+        thumbnail_path = os.path.join(
+            str(size), f"{node_id}.{THUMBNAIL_FORMAT.lower()}"
+        )
+        os.makedirs(os.path.join(thumbnail_directory, str(size)), exist_ok=True)
+        _save_image(
+            square.resize((size, size), Image.LANCZOS),
+            os.path.join(thumbnail_directory, thumbnail_path),
+            THUMBNAIL_FORMAT,
+        )
+        thumbnail_paths[str(size)] = thumbnail_path
+    return source_hash, thumbnail_paths
 
-        # Get the dimensions of the image
-        width, height = image.size
 
-        # Calculate the crop dimensions
-        crop_height = int(height * fraction_to_keep)  # Keep 90% of the original height
+def _load_thumbnail_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)["portraits"]
+
+
+def _save_thumbnail_manifest(path, portraits):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({"portraits": portraits}, file, indent=1, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def create_thumbnails(
+    image_directory,
+    thumbnail_directory,
+    sizes,
+    crop_fraction,
+    sources_cropped=False,
+    num_processes=None,
+):
+    """
+    Create the thumbnails of the portraits in image_directory with
+    create_portrait_thumbnails, in a pool of num_processes processes. The thumbnail manifest
+    in thumbnail_directory holds the hash of each portrait and the crop fraction its
+    thumbnails were cut with, so thumbnails are only created for portraits that are new or
+    were downloaded again, and running this again does nothing. The manifest is saved as
+    thumbnails are created, and a portrait that fails keeps its entry of the last run, so it
+    is retried by the next run unless its old thumbnails are complete.
+    With sources_cropped, portraits that are not in the manifest are taken to be cropped
+    already, e.g. by an earlier version of this script, which cropped them in place.
+    """
+    os.makedirs(thumbnail_directory, exist_ok=True)
+    manifest_path = os.path.join(thumbnail_directory, THUMBNAIL_MANIFEST_NAME)
+    old_portraits = _load_thumbnail_manifest(manifest_path)
+    portraits = {}
+
+    tasks = {}
+    for file_name in sorted(os.listdir(image_directory)):
+        node_id, extension = os.path.splitext(file_name)
+        if extension != ".png":
+            continue
+        source_path = os.path.join(image_directory, file_name)
+        entry = old_portraits.get(node_id)
+        is_unchanged = entry is not None and _hash_file(source_path) == entry["hash"]
+        # Entries written by earlier versions have no crop fraction, since they cropped the
+        # portrait in place
+        if is_unchanged:
+            portrait_crop_fraction = entry.get("crop_fraction")
+        elif entry is None and sources_cropped:
+            portrait_crop_fraction = None
+        else:
+            portrait_crop_fraction = crop_fraction
+        is_up_to_date = (
+            is_unchanged
+            and entry["thumbnails"].keys() == {str(size) for size in sizes}
+            and all(
+                os.path.exists(os.path.join(thumbnail_directory, path))
+                for path in entry["thumbnails"].values()
+            )
+        )
+        if is_up_to_date:
+            portraits[node_id] = dict(entry, crop_fraction=portrait_crop_fraction)
+        else:
+            tasks[node_id] = (
+                source_path,
+                thumbnail_directory,
+                sizes,
+                portrait_crop_fraction,
+            )
+
+    print(
+        f"Creating thumbnails of {len(tasks)} of {len(tasks) + len(portraits)} portraits"
+    )
+    # Until its thumbnails are created, a portrait keeps its old entry in the saved manifest
+    pending_portraits = {
+        node_id: old_portraits[node_id] for node_id in tasks if node_id in old_portraits
+    }
+    num_failed = 0
+    last_save_time = time.monotonic()
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        futures = {
+            executor.submit(create_portrait_thumbnails, node_id, *task): node_id
+            for node_id, task in tasks.items()
+        }
+        for future in as_completed(futures):
+            node_id = futures[future]
+            pending_portraits.pop(node_id, None)
+            try:
+                source_hash, thumbnail_paths = future.result()
+            except Exception as error:
+                num_failed += 1
+                print(f"Failed to create the thumbnails of {node_id}: {error}")
+                if node_id in old_portraits:
+                    portraits[node_id] = old_portraits[node_id]
+                continue
+            portraits[node_id] = {
+                "hash": source_hash,
+                "crop_fraction": tasks[node_id][3],
+                "thumbnails": thumbnail_paths,
+            }
+            if time.monotonic() - last_save_time >= STATE_SAVE_INTERVAL_SECONDS:
+                _save_thumbnail_manifest(
+                    manifest_path, {**pending_portraits, **portraits}
+                )
+                last_save_time = time.monotonic()
 
-        # Crop the image
-        cropped_image = image.crop((0, 0, width, crop_height))
+    # Thumbnails of removed portraits and sizes are left out of the manifest, and deleted
+    for node_id, entry in old_portraits.items():
+        kept_paths = set(portraits.get(node_id, {}).get("thumbnails", {}).values())
+        for path in set(entry["thumbnails"].values()) - kept_paths:
+            path = os.path.join(thumbnail_directory, path)
+            if os.path.exists(path):
+                os.remove(path)
 
-        # Save the cropped image, overwriting the original file
-        cropped_image.save(image_path)
+    _save_thumbnail_manifest(manifest_path, portraits)
+    if num_failed > 0:
+        print(f"Thumbnails of {num_failed} portraits failed, run again to retry them")
+    else:
+        print("Thumbnails complete!")
 
-        # Close the image
-        image.close()
 
-    print("Cropping complete!")
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Download the portraits of the nodes from their wiki pages"
+    )
+    parser.add_argument("--base-url", default=PORTRAIT_WIKI_BASE_URL)
+    parser.add_argument("--nodes-path", default=NODE_PATH)
+    parser.add_argument("--image-directory", default=FILE_PATH_FOR_IMAGES)
+    parser.add_argument("--thumbnail-directory", default=PORTRAIT_THUMBNAIL_DIRECTORY)
+    parser.add_argument("--state-path", default=PORTRAIT_STATE_PATH)
+    parser.add_argument("--workers", type=int, default=PORTRAIT_DOWNLOAD_WORKERS)
+    parser.add_argument(
+        "--requests-per-second",
+        type=float,
+        default=PORTRAIT_REQUESTS_PER_SECOND_PER_HOST,
+        help="Maximum requests per second to each host",
+    )
+    parser.add_argument("--retries", type=int, default=PORTRAIT_DOWNLOAD_RETRIES)
+    parser.add_argument(
+        "--timeout", type=float, default=PORTRAIT_DOWNLOAD_TIMEOUT_SECONDS
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Processes creating thumbnails, by default one per CPU",
+    )
+    parser.add_argument(
+        "--skip-download",
+        action="store_true",
+        help="Only create the thumbnails of the portraits",
+    )
+    parser.add_argument(
+        "--sources-cropped",
+        action="store_true",
+        help="Portraits that are not in the thumbnail manifest are already cropped",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    nodes, _ = load_got()
-    nodes = create_wiki_urls(nodes)
-    nodes = add_image_urls_to_nodes_file(nodes)
-    nodes.to_csv(NODE_PATH, index=False)
-    download_images(nodes)
-    # Call the function to crop the images
-    crop_images(FILE_PATH_FOR_IMAGES, fraction_to_keep=0.7)
+    arguments = parse_arguments()
+    if not arguments.skip_download:
+        nodes = pd.read_csv(arguments.nodes_path)
+        nodes = create_wiki_urls(nodes, arguments.base_url)
+
+        downloader = PortraitDownloader(
+            create_session(arguments.workers),
+            HostRateLimiter(arguments.requests_per_second),
+            arguments.retries,
+            arguments.timeout,
+            arguments.image_directory,
+        )
+        state = DownloadState(arguments.state_path)
+        nodes = download_portraits(nodes, downloader, state, arguments.workers)
+        nodes.to_csv(arguments.nodes_path, index=False)
+
+    create_thumbnails(
+        arguments.image_directory,
+        arguments.thumbnail_directory,
+        PORTRAIT_THUMBNAIL_SIZES,
+        PORTRAIT_CROP_FRACTION,
+        sources_cropped=arguments.sources_cropped,
+        num_processes=arguments.processes,
+    )
@@ -0,0 +1,225 @@
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+import flask
+import plotly
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# The data time of the callback running in the current thread, see CallbackMetrics
+_current_callback = threading.local()
+
+
+class Histogram:
+    """
+    Prometheus style histogram with one series of cumulative buckets per callback
+    """
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, callback_name, value):
+        series = self._series.setdefault(
+            callback_name, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        )
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def to_text(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for callback_name, series in sorted(self._series.items()):
+            label = f'callback="{callback_name}"'
+            for bucket, count in zip(self.buckets, series["buckets"]):
+                lines.append(f'{self.name}_bucket{{{label},le="{bucket}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series["count"]}')
+            lines.append(f"{self.name}_sum{{{label}}} {series['sum']}")
+            lines.append(f"{self.name}_count{{{label}}} {series['count']}")
+        return "\n".join(lines)
+
+
+class _InstrumentedApp:
+    """
+    Stands in for the dash app when registering callbacks, and instruments every callback
+    registered through it
+    """
+
+    def __init__(self, app, callback_metrics):
+        self._app = app
+        self._callback_metrics = callback_metrics
+
+    def __getattr__(self, name):
+        # E.g. clientside_callback, which runs in the browser and is not instrumented
+        return getattr(self._app, name)
+
+    def callback(self, *args, **kwargs):
+        def decorator(function):
+            return self._app.callback(*args, **kwargs)(
+                self._callback_metrics.instrument_callback(function)
+            )
+
+        return decorator
+
+
+class CallbackMetrics:
+    """
+    Records for each dash callback its wall time, the part of it spent in methods of the
+    instrumented data classes, and the size of its serialized response, as histograms.
+    Callbacks slower than slow_callback_threshold_seconds are logged.
+    """
+
+    def __init__(self, slow_callback_threshold_seconds):
+        self.slow_callback_threshold_seconds = slow_callback_threshold_seconds
+        self.duration = Histogram(
+            "dash_callback_duration_seconds",
+            "Wall time of the callback.",
+            DURATION_BUCKETS,
+        )
+        self.data_duration = Histogram(
+            "dash_callback_data_duration_seconds",
+            "Time of the callback spent in GraphData and DFGraph methods.",
+            DURATION_BUCKETS,
+        )
+        self.response_size = Histogram(
+            "dash_callback_response_size_bytes",
+            "Size of the JSON serialized response of the callback.",
+            SIZE_BUCKETS,
+        )
+        self._lock = threading.Lock()
+        self._caches = {}
+
+    def register_cache(self, name, cache):
+        """
+        Also serve the hit and miss counts and the size of a data.result_cache.ResultCache
+        """
+        self._caches[name] = cache
+
+    def instrument_app(self, app):
+        return _InstrumentedApp(app, self)
+
+    def instrument_callback(self, function):
+        @functools.wraps(function)
+        def instrumented_callback(*args, **kwargs):
+            _current_callback.data_seconds = 0.0
+            _current_callback.depth = 0
+            start = time.perf_counter()
+            try:
+                return_value = function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                data_seconds = _current_callback.data_seconds
+                del _current_callback.data_seconds
+
+            response_size = len(
+                json.dumps(return_value, cls=plotly.utils.PlotlyJSONEncoder)
+            )
+            with self._lock:
+                self.duration.observe(function.__name__, seconds)
+                self.data_duration.observe(function.__name__, data_seconds)
+                self.response_size.observe(function.__name__, response_size)
+
+            if seconds > self.slow_callback_threshold_seconds:
+                logger.warning(
+                    "Slow callback %s: %.3f s, of which %.3f s in data methods, %d byte response",
+                    function.__name__,
+                    seconds,
+                    data_seconds,
+                    response_size,
+                )
+            return return_value
+
+        return instrumented_callback
+
+    @staticmethod
+    def instrument_classes(*classes):
+        """
+        Time the methods of the given classes when they are called from an instrumented
+        callback. Methods called from other instrumented methods are included in the time of
+        the outermost one.
+        """
+        for cls in classes:
+            for name, method in list(vars(cls).items()):
+                if inspect.isfunction(method) and not name.startswith("__"):
+                    setattr(cls, name, _instrument_method(method))
+
+    def _caches_to_text(self):
+        metrics = [
+            (
+                "result_cache_hits_total",
+                "counter",
+                "Lookups found in the cache.",
+                lambda cache: cache.hits,
+            ),
+            (
+                "result_cache_misses_total",
+                "counter",
+                "Lookups not found in the cache.",
+                lambda cache: cache.misses,
+            ),
+            ("result_cache_entries", "gauge", "Number of cached results.", len),
+            (
+                "result_cache_bytes",
+                "gauge",
+                "Memory used by cached results.",
+                lambda cache: cache.memory_usage(),
+            ),
+        ]
+        lines = []
+        for metric_name, metric_type, description, get_value in metrics:
+            lines.append(f"# HELP {metric_name} {description}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for cache_name, cache in sorted(self._caches.items()):
+                lines.append(
+                    f'{metric_name}{{cache="{cache_name}"}} {get_value(cache)}'
+                )
+        return "\n".join(lines)
+
+    def to_text(self):
+        with self._lock:
+            histograms = [self.duration, self.data_duration, self.response_size]
+            text = "\n".join(histogram.to_text() for histogram in histograms)
+        if self._caches:
+            text += "\n" + self._caches_to_text()
+        return text + "\n"
+
+    def register_route(self, server, path="/metrics"):
+        """
+        Serve the metrics in the Prometheus text format on the flask server of the app
+        """
+
+        def metrics():
+            return flask.Response(self.to_text(), mimetype="text/plain; version=0.0.4")
+
+        server.add_url_rule(path, "metrics", metrics)
+
+
+def _instrument_method(method):
+    @functools.wraps(method)
+    def instrumented_method(*args, **kwargs):
+        if getattr(_current_callback, "data_seconds", None) is None:
+            return method(*args, **kwargs)
+
+        _current_callback.depth += 1
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _current_callback.depth -= 1
+            if _current_callback.depth == 0:
+                _current_callback.data_seconds += time.perf_counter() - start
+
+    return instrumented_method
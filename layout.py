@@ -1,15 +1,22 @@
+import uuid
 from dash import dcc, html, dash_table
 from dash.dash_table.Format import Format
 import visdcc
-from data.graphdata import GraphData
+from data.graphdata import get_shared_graph_data, VISDCC_NODE_OPTIONS
+from data.centrality import CENTRALITY_METRICS, DEFAULT_CENTRALITY_METRIC
 
 # Load what is needed from data, e.g. to create dropdown options.
-data = GraphData()
+data = get_shared_graph_data()
 edge_weight_min = data.graph_whole.edge_weight_min
 edge_weight_max = data.graph_whole.edge_weight_max
 node_screentime_min = data.graph_whole.screentime_min
 node_screentime_max = data.graph_whole.screentime_max
+# The node dropdowns start with the top ranked nodes, and are searched server side, see
+# callbacks.callback_search_node_options
 options_for_dropdown = data.get_options_for_dropdown()
+centrality_options = [
+    {"label": label, "value": metric} for metric, label in CENTRALITY_METRICS.items()
+]
 
 ## ------------------------------------------------------------------------------- ##
 ## Header Section  ##
@@ -35,6 +42,8 @@ graph_interaction_input = dcc.Dropdown(
     options=[
         {"label": "Expand Node", "value": "expand_node"},
         {"label": "Delete Node", "value": "delete_node"},
+        {"label": "Expand Community", "value": "expand_community"},
+        {"label": "Show Path", "value": "show_path"},
         {"label": "Node Wiki", "value": "node_wiki"},
         {"label": "None", "value": "none"},
     ],
@@ -65,6 +74,21 @@ search_node_id_input = dcc.Dropdown(
     className="header field_description",
 )
 
+# path_target_node_id
+path_target_node_id_header = html.Div(
+    id="path_target_node_id_header",
+    children="Path To Node ID",
+    className="header field_description",
+)
+
+path_target_node_id_input = dcc.Dropdown(
+    id="path_target_node_id_input",
+    options=options_for_dropdown,
+    multi=False,
+    placeholder="Enter node ID to show the path to...",
+    className="header field_description",
+)
+
 # expand_num_hops
 expand_num_hops_header = html.Div(
     id="expand_num_hops_header",
@@ -128,6 +152,49 @@ filter_node_screentime_input = html.Div(
     className="header field_description slider_input_section",
 )
 
+# filter_centrality
+# Centrality metrics are heavy-tailed, so they are filtered by percentile, see data/centrality.py
+filter_centrality_header = html.Div(
+    id="filter_centrality_header",
+    children="Minimum Centrality Percentile",
+    className="header field_description",
+)
+
+filter_centrality_input = html.Div(
+    children=[
+        dcc.Dropdown(
+            id="filter_centrality_metric_input",
+            options=centrality_options,
+            multi=False,
+            clearable=False,
+            value=DEFAULT_CENTRALITY_METRIC,
+            className="header field_description",
+        ),
+        html.Div(
+            children=[
+                dcc.Slider(
+                    id="filter_centrality_slider_input",
+                    min=0,
+                    max=100,
+                    value=0,
+                    className="slider_section",
+                ),
+                dcc.Input(
+                    id="filter_centrality_input_input",
+                    type="number",
+                    inputMode="numeric",
+                    debounce=True,
+                    min=0,
+                    max=100,
+                    value=0,
+                    className="input_section",
+                ),
+            ],
+            className="header field_description slider_input_section",
+        ),
+    ],
+)
+
 # filter_edge_weight
 filter_edge_weight_header = html.Div(
     id="filter_edge_weight_header",
@@ -158,6 +225,22 @@ filter_edge_weight_input = html.Div(
     className="header field_description slider_input_section",
 )
 
+# node_size_metric
+node_size_metric_header = html.Div(
+    id="node_size_metric_header",
+    children="Node Size",
+    className="header field_description",
+)
+
+node_size_metric_input = dcc.Dropdown(
+    id="node_size_metric_input",
+    options=[{"label": "Screentime", "value": "screentime"}] + centrality_options,
+    multi=False,
+    clearable=False,
+    value="screentime",
+    className="header field_description",
+)
+
 # submit_button
 submit_button = html.Button(
     id="submit_button",
@@ -200,14 +283,20 @@ menu_section = html.Div(
         search_menu_header,
         search_node_id_header,
         search_node_id_input,
+        path_target_node_id_header,
+        path_target_node_id_input,
         expand_num_hops_header,
         expand_num_hops_input,
         filter_node_type_header,
         filter_node_type_input,
         filter_node_screentime_header,
         filter_node_screentime_input,
+        filter_centrality_header,
+        filter_centrality_input,
         filter_edge_weight_header,
         filter_edge_weight_input,
+        node_size_metric_header,
+        node_size_metric_input,
         submit_button,
         html.Hr(className="horizontal-line"),
         search_result_header,
@@ -223,19 +312,22 @@ network_component = visdcc.Network(
     id="network_visualization",
     data={"nodes": [], "edges": []},
     options=dict(
-        physics={
-            "enabled": True,
-            # "solver": "barnesHut",
-            "solver": "repulsion",
-            # "solver": "forceAtlas2Based",
-        },
+        # Node coordinates are computed server side, see data/graph_layout.py
+        physics={"enabled": False},
+        layout={"improvedLayout": False},
         interaction={"hover": True},
+        **VISDCC_NODE_OPTIONS,
     ),
 )
 
+# Incremented by callbacks.callback_network_visualization every time the network changes,
+# since changes are sent through the network's run property and leave its data unchanged.
+network_revision = dcc.Store(id="network_revision", data=0)
+
 graph_section = html.Div(
     children=[
         network_component,
+        network_revision,
     ],
     className="graph_section",
 )
@@ -253,13 +345,24 @@ dashboard_section = html.Div(
     className="dashboard_section",
 )
 
+
 ## ------------------------------------------------------------------------------- ##
 ## Layout  ##
 ## ------------------------------------------------------------------------------- ##
-# Putting together the final layout
-layout = html.Div(
-    children=[
-        header,
-        dashboard_section,
-    ],
-)
+# Putting together the final layout.
+# This is a function so that dash calls it on every page load, giving each page its own
+# session id. The id is the key of the page's graph state in callbacks.session_store.
+def layout():
+    session_id = dcc.Store(
+        id="session_id",
+        storage_type="memory",
+        data=str(uuid.uuid4()),
+    )
+
+    return html.Div(
+        children=[
+            session_id,
+            header,
+            dashboard_section,
+        ],
+    )